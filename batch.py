@@ -0,0 +1,274 @@
+# A vectorized version of the table in blackjack.py
+#
+# Instead of playing one shoe at a time, this plays many independent tables in lockstep.
+# Every table's shoe is a row of one 2-D array of card values, and every player's hand,
+# bet and bankroll is a column of numbers, so each step of a hand (deal, play, resolve,
+# count) is a handful of numpy operations across all the tables at once.
+#
+# The rules are the same as runSimulation in blackjack.py, warts and all, so that
+# replaying the same shoes through both gives the same rows of winnings.
+from array import array
+from functools import lru_cache
+
+import numpy as np
+
+from blackjack import BET_PLAY_MATRIX, BET_RAMP, Shoe, SYSTEM_NAMES, runSimulation
+from counting import COUNTING_SYSTEMS
+from handstate import DOUBLE, EMPTY, NEXT, STAND, TOTAL, TWO_CARDS, compileStrategy
+
+# The hand state machine from handstate.py as arrays, so a whole column of hands can take a
+# card, or look up its total or what to do next, in one step
+NEXT_STATE = np.array(NEXT, dtype=np.int64)
+TOTALS = np.array(TOTAL, dtype=np.int64)
+CAN_DOUBLE = np.array(TWO_CARDS, dtype=bool)
+STRATEGY = np.array(compileStrategy(BET_PLAY_MATRIX), dtype=np.int8)
+
+# Count tags indexed by card value (ace is 11), one row per counting player
+# in the order they sit at the table
+TAGS = np.array([COUNTING_SYSTEMS[name] for name in SYSTEM_NAMES[1:]], dtype=np.int64)
+
+NUM_SEATS = len(SYSTEM_NAMES)
+
+# Goes up whenever a change makes the engine give different winnings for the same seed,
+# so results saved by an older version (see sweepcache.py) aren't mixed in with new ones
+ENGINE_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def baseShoe(numDecks):
+    """The cards of an unshuffled shoe, in the same order Shoe builds them
+
+    It's built once per number of decks and shared, so it's read-only."""
+    cards = np.array(Shoe(numDecks).cards, dtype=np.int8)
+    cards.setflags(write=False)
+    return cards
+
+
+def makeRngs(seed, numTables):
+    """One independent numpy generator per table, all spawned from a single seed"""
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(numTables)]
+
+
+class BatchTable:
+    """Many tables of the five players from blackjack.py, played in lockstep"""
+
+    def __init__(self, decks, rngs, dealerPlays=False, recordShoes=False, penetration=None, betRamp=None,
+                 strategy=None):
+        """decks is the number of decks for each table, rngs a numpy Generator for each table
+
+        penetration works like it does for Shoe, the shoes are reshuffled between hands
+        once that fraction of the cards has been dealt.  betRamp is the counters' bets, like
+        blackjack.BET_RAMP (the default).  strategy is a strategy[state][dealer card] table
+        for everyone, the compiled BET_PLAY_MATRIX by default."""
+        self.decks = np.asarray(decks, dtype=np.int64)
+        self.numTables = len(self.decks)
+        self.rngs = rngs
+        self.dealerPlays = dealerPlays
+        self.betRamp = np.asarray(BET_RAMP if betRamp is None else betRamp, dtype=np.int64)
+        self.strategy = STRATEGY if strategy is None else np.array(strategy, dtype=np.int8)
+        self.tables = np.arange(self.numTables)
+
+        # Each shoe is a row, dealt from the end like list.pop().  Tables with fewer
+        # decks just don't use the tail of their row.
+        self.bases = {}
+        for d in set(self.decks.tolist()):
+            self.bases[d] = baseShoe(d)
+        self.size = 52*self.decks
+        self.shoes = np.zeros((self.numTables, self.size.max()), dtype=np.int8)
+        for t in range(self.numTables):
+            # blackjack.py never shuffles the first shoe, it starts dealing right out of the box
+            self.shoes[t, :self.size[t]] = self.bases[self.decks[t]]
+        self.left = self.size.copy()
+        self.pips = 380*self.decks  # pip total of what's left, what the counters' true count divides by
+        if penetration is None:
+            self.cutCard = np.zeros(self.numTables, dtype=np.int64)
+        else:
+            self.cutCard = np.round(self.size*(1-penetration)).astype(np.int64)
+        self.refill = np.zeros(self.numTables, dtype=bool)
+        self.shoeLog = [[] for t in range(self.numTables)] if recordShoes else None
+
+        self.money = np.full((NUM_SEATS, self.numTables), 10000, dtype=np.int64)
+        self.cardCount = np.zeros((len(TAGS), self.numTables), dtype=np.int64)
+        self.trueCount = np.zeros((len(TAGS), self.numTables), dtype=np.int64)
+
+    def refillShoes(self, tables):
+        """Throws away what's left in these shoes and starts each one over with a fresh shuffle"""
+        for t in tables:
+            cards = self.rngs[t].permutation(self.bases[self.decks[t]])
+            self.shoes[t, :self.size[t]] = cards
+            if self.shoeLog is not None:
+                self.shoeLog[t].append(cards)
+        self.left[tables] = self.size[tables]
+        self.pips[tables] = 380*self.decks[tables]
+        self.refill[tables] = True
+
+    def deal(self, tables):
+        """Deals the next card from the shoe of each of these tables"""
+        empty = tables[self.left[tables] < 1]
+        if len(empty):
+            self.refillShoes(empty)
+        self.left[tables] -= 1
+        cards = self.shoes[tables, self.left[tables]].astype(np.int64)
+        self.pips[tables] -= cards
+        self.seen[tables, cards] += 1
+        return cards
+
+    def dealTwo(self, tables):
+        """Deals two cards to each of these tables, refilling first if either is missing"""
+        short = tables[self.left[tables] < 2]
+        if len(short):
+            self.refillShoes(short)
+        return self.deal(tables), self.deal(tables)
+
+    def playSeat(self, seat, upCard):
+        """Plays one seat at every table until it stands, returns the total payout sees and who doubled"""
+        tables = self.tables
+        state = self.states[seat]
+        reported = np.zeros(self.numTables, dtype=np.int64)
+        doubled = np.zeros(self.numTables, dtype=bool)
+        active = np.ones(self.numTables, dtype=bool)
+        while True:
+            idx = tables[active]
+            if not len(idx):
+                break
+            st = state[idx]
+            reported[idx] = TOTALS[st]
+            whatToDo = self.strategy[st, upCard[idx]]
+            # a double on more than two cards is a stand, like Player.play
+            double = (whatToDo == DOUBLE) & CAN_DOUBLE[st]
+            stand = (whatToDo == STAND) | ((whatToDo == DOUBLE) & ~double)
+            active[idx[stand | double]] = False
+            doubled[idx[double]] = True
+            # The player's total isn't looked at again after a double, so payout sees
+            # the total from before the last card.  reported already holds it.
+            drawTo = idx[~stand]
+            if len(drawTo):
+                state[drawTo] = NEXT_STATE[state[drawTo], self.deal(drawTo)]
+        return reported, doubled
+
+    def playDealer(self):
+        """Dealer hits below 17 at every table"""
+        tables = self.tables
+        while True:
+            t = TOTALS[self.dealerState]
+            idx = tables[(t != -1) & (t < 17)]
+            if not len(idx):
+                break
+            self.dealerState[idx] = NEXT_STATE[self.dealerState[idx], self.deal(idx)]
+
+    def playHand(self):
+        """Plays one hand at every table"""
+        n = self.numTables
+        tables = self.tables
+        cut = tables[self.left <= self.cutCard]
+        if len(cut):
+            self.refillShoes(cut)
+        self.seen = np.zeros((n, 12), dtype=np.int64)
+
+        # DEAL
+        self.states = np.zeros((NUM_SEATS, n), dtype=np.int64)
+        for seat in range(NUM_SEATS):
+            first, second = self.dealTwo(tables)
+            self.states[seat] = NEXT_STATE[NEXT_STATE[EMPTY, first], second]
+        hidden, upCard = self.dealTwo(tables)
+        self.dealerState = NEXT_STATE[NEXT_STATE[EMPTY, hidden], upCard]
+
+        # PLAY
+        bets = np.zeros((NUM_SEATS, n), dtype=np.int64)
+        staked = np.zeros((NUM_SEATS, n), dtype=np.int64)
+        reported = np.zeros((NUM_SEATS, n), dtype=np.int64)
+        self.betCount = np.zeros((NUM_SEATS, n), dtype=np.int64)
+        self.betTrueCount = np.zeros((NUM_SEATS, n), dtype=np.int64)
+        for seat in range(NUM_SEATS):
+            if seat == 0:
+                bet = np.full(n, 100, dtype=np.int64)
+            else:
+                # The first counter to play after a refill is the one that notices it
+                count = self.cardCount[seat-1]
+                count[self.refill] = 0
+                self.trueCount[seat-1, self.refill] = 0
+                self.refill[:] = False
+                self.betCount[seat] = count
+                self.betTrueCount[seat] = self.trueCount[seat-1]
+                bet = self.betRamp[np.clip(count-1, 0, len(self.betRamp)-1)]
+            self.money[seat] -= bet
+            staked[seat] = bet
+            reported[seat], doubled = self.playSeat(seat, upCard)
+            bets[seat] = np.where(doubled, 2*bet, bet)
+        if self.dealerPlays:
+            self.playDealer()
+            dealer = TOTALS[self.dealerState]
+        else:
+            dealer = np.zeros(n, dtype=np.int64)
+
+        # RESOLVE HAND, the same checks in the same order as payout()
+        playerBJ = reported == -1
+        dealerBJ = dealer == -1
+        paid = np.where(dealerBJ & ~playerBJ, 0,
+               np.where(playerBJ & ~dealerBJ, 3,
+               np.where(playerBJ & dealerBJ, 2,
+               np.where(reported > 21, 0,
+               np.where(dealer > 21, 2,
+               np.where(dealer > reported, 0, 2))))))
+        self.money += bets*paid
+        self.bets = bets
+        self.staked = staked
+        # Only the first bet comes out of the bankroll up front, doubling doesn't take
+        # the second half out, so net is what the bankroll actually moved by
+        self.net = bets*paid - staked
+
+        # COUNT CARDS, every card that hit the table this hand
+        self.cardCount += TAGS @ self.seen.T
+        self.cardCount[:, self.left == 0] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.trueCount = np.where(self.pips > 0, np.round(self.cardCount/(self.pips/52.0)), 0).astype(np.int64)
+
+    def run(self, hands=200, onHand=None):
+        """Plays the hands and returns each table's winnings, one column per player
+
+        onHand(k, table) is called after hand k is played, when bets, net, betCount and
+        betTrueCount hold what each seat bet, won and counted on that hand, and staked what
+        it bet before any double."""
+        for k in range(hands):
+            self.playHand()
+            if onHand is not None:
+                onHand(k, self)
+        return (self.money - 10000).T
+
+
+def runBatch(decks, seed=None, hands=200, dealerPlays=False, penetration=None, betRamp=None):
+    """Plays one table per entry of decks and returns a (tables, players) array of winnings"""
+    rngs = makeRngs(seed, len(decks))
+    return BatchTable(decks, rngs, dealerPlays, penetration=penetration, betRamp=betRamp).run(hands)
+
+
+class ReplayShoe(Shoe):
+    """A Shoe that deals a recorded list of shuffles instead of making new ones"""
+
+    def __init__(self, num=6, shuffles=None, penetration=None):
+        self.shuffles = iter(shuffles)
+        Shoe.__init__(self, num, penetration=penetration)
+
+    def shuffle(self):
+        self.cards[:] = array("b", next(self.shuffles).tobytes())
+
+
+def checkAgainstLoop(decks, seed=None, hands=200, dealerPlays=False, penetration=None, betRamp=None, strategy=None):
+    """Replays the batch engine's shoes through runSimulation and makes sure the rows agree"""
+    table = BatchTable(decks, makeRngs(seed, len(decks)), dealerPlays, recordShoes=True, penetration=penetration,
+                       betRamp=betRamp, strategy=strategy)
+    rows = table.run(hands)
+    for t, d in enumerate(decks):
+        expected = runSimulation(ReplayShoe(int(d), table.shoeLog[t], penetration), hands, dealerPlays,
+                                 betRamp=betRamp, strategy=strategy)
+        if list(rows[t]) != expected:
+            raise AssertionError("table %d with %d decks: batch %s, loop %s" % (t, d, list(rows[t]), expected))
+
+
+if __name__ == "__main__":
+    # Same sweep and output as blackjack.py, 100 simulations for each of 4 through 8 decks
+    decks = np.repeat(np.arange(4, 9), 100)
+    rows = runBatch(decks)
+    for d, winnings in zip(decks, rows):
+        for won, name in zip(winnings, SYSTEM_NAMES):
+            print(won, ",", d, ",", name)
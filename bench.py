@@ -0,0 +1,286 @@
+# Speed measurements for the simulator
+#
+# python bench.py                       run everything, print a table
+# python bench.py --json now.json       also save the numbers
+# python bench.py --save-baseline       save this run as the baseline (bench_baseline.json)
+# python bench.py --baseline base.json  compare to an earlier run, exit 1 if anything got slower
+#                                       (bench_baseline.json is used if it exists and no file is given)
+# python bench.py --shuffle-table       shuffles per second for every shuffle mode and shoe size
+#
+# Everything is seeded, so two runs do exactly the same work and only the clock differs.
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import numpy as np
+
+from batch import BatchTable, makeRngs
+from blackjack import BufferedSystemRandom, CountingPlayer, Dealer, Player, Shoe, payout, runSimulation, total
+from counting import COUNTING_SYSTEMS
+from csm import CSMShoe
+
+# Each shuffle mode is a function that makes a shoe of the given size using it
+SHUFFLE_MODES = [
+    ("paranoid", lambda decks: Shoe(decks)),
+    ("SystemRandom", lambda decks: Shoe(decks, random.SystemRandom())),
+    ("BufferedSystemRandom", lambda decks: Shoe(decks, BufferedSystemRandom())),
+    ("Mersenne Twister", lambda decks: Shoe(decks, random.Random(1))),
+    ("PCG64", lambda decks: Shoe(decks, np.random.Generator(np.random.PCG64(1)))),
+    ("Philox", lambda decks: Shoe(decks, np.random.Generator(np.random.Philox(1)))),
+]
+
+DECKS = range(4, 9)
+BASELINE = "bench_baseline.json"
+
+
+def timeIt(f, minTime=0.2, repeats=1):
+    """Calls f until at least minTime seconds have gone by and returns the seconds per call
+
+    With repeats it does that several times and keeps the fastest, which is the one the
+    rest of the machine got in the way of the least."""
+    best = None
+    for r in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            f()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= minTime:
+                break
+        if best is None or elapsed/calls < best:
+            best = elapsed/calls
+    return best
+
+
+def benchShuffle(decks=DECKS, minTime=0.2):
+    """Returns {(mode, decks): shuffles per second} for every shuffle mode"""
+    results = {}
+    for name, makeShoe in SHUFFLE_MODES:
+        for d in decks:
+            shoe = makeShoe(d)
+            results[(name, d)] = 1.0/timeIt(shoe.shuffle, minTime)
+    return results
+
+
+# MICRO BENCHMARKS
+# Each one is set up by a function returning (f, ops), where one call to f does ops operations
+
+def randomHands(n, seed=1):
+    rng = random.Random(seed)
+    cards = [2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11]
+    return [[rng.choice(cards) for k in range(rng.randint(2, 5))] for i in range(n)]
+
+
+def setupTotal():
+    hands = randomHands(1000)
+    def f():
+        for hand in hands:
+            total(hand)
+    return f, len(hands)
+
+
+def setupPayout():
+    class Hand:
+        pass
+    rng = random.Random(2)
+    pairs = []
+    for i in range(1000):
+        player, dealer = Hand(), Hand()
+        player.total = rng.choice([-1] + list(range(4, 27)))
+        dealer.total = rng.choice([-1] + list(range(17, 27)))
+        pairs.append((player, dealer))
+    def f():
+        for player, dealer in pairs:
+            payout(player, dealer)
+    return f, len(pairs)
+
+
+# The shoe is put back together with fill() at the start of every pass, which doesn't
+# shuffle, and a pass deals fewer cards than it holds, so no shuffle ends up in the timing
+def dealtFrom(shoe):
+    if shoe.refill:
+        raise RuntimeError("the shoe ran out and was shuffled during the timing")
+
+
+def setupDeal():
+    shoe = Shoe(6, np.random.default_rng(3))
+    shoe.shuffle()
+    def f():
+        shoe.fill()
+        for i in range(150):  # 300 of the 312 cards
+            shoe.deal(2)
+        dealtFrom(shoe)
+    return f, 150
+
+
+def setupShuffle(decks):
+    def setup():
+        shoe = Shoe(decks, np.random.default_rng(4))
+        return shoe.shuffle, 1
+    return setup
+
+
+def setupCountCard(system):
+    def setup():
+        shoe = Shoe(6, np.random.default_rng(5))
+        shoe.shuffle()
+        counter = CountingPlayer(system)
+        rounds = randomHands(200, seed=6)
+        def f():
+            for cards in rounds:
+                counter.countCard(cards, shoe)
+        return f, len(rounds)
+    return setup
+
+
+def setupDealerPlay():
+    shoe = Shoe(8, np.random.default_rng(7))
+    shoe.shuffle()
+    dealer = Dealer()
+    def f():
+        shoe.fill()
+        for i in range(100):  # about 300 of the 416 cards
+            dealer.dealToSelf(shoe)
+            dealer.play(shoe)
+        dealtFrom(shoe)
+    return f, 100
+
+
+def setupPlayerPlay():
+    shoe = Shoe(8, np.random.default_rng(8))
+    shoe.shuffle()
+    player = Player()
+    def f():
+        shoe.fill()
+        for i in range(100):  # about 300 of the 416 cards
+            player.dealToSelf(shoe)
+            player.play(shoe, 10)
+        dealtFrom(shoe)
+    return f, 100
+
+
+MICRO = [("total", setupTotal),
+         ("payout", setupPayout),
+         ("Shoe.deal(2)", setupDeal),
+         ("Dealer.play", setupDealerPlay),
+         ("Player.play", setupPlayerPlay)]
+MICRO += [("Shoe.shuffle[%d decks]" % d, setupShuffle(d)) for d in DECKS]
+MICRO += [("countCard[%s]" % name, setupCountCard(name)) for name in COUNTING_SYSTEMS]
+
+
+# MACRO BENCHMARKS
+# Each one is set up by a function returning (f, hands), where one call to f plays that many table rounds
+
+def setupRounds(decks):
+    def setup():
+        seeds = iter(range(1 << 30))
+        def f():
+            runSimulation(Shoe(decks, np.random.default_rng(next(seeds))), 200, dealerPlays=True)
+        return f, 200
+    return setup
+
+
+def setupCsmRounds(decks):
+    def setup():
+        seeds = iter(range(1 << 30))
+        def f():
+            runSimulation(CSMShoe(decks, np.random.default_rng(next(seeds))), 200, dealerPlays=True)
+        return f, 200
+    return setup
+
+
+def setupBatchRounds(decks, tables=1000):
+    def setup():
+        seeds = iter(range(1 << 30))
+        def f():
+            BatchTable([decks]*tables, makeRngs(next(seeds), tables), dealerPlays=True).run(20)
+        return f, 20*tables
+    return setup
+
+
+MACRO = [("round[%d decks]" % d, setupRounds(d)) for d in DECKS]
+MACRO += [("csm round[%d decks]" % d, setupCsmRounds(d)) for d in DECKS]
+MACRO += [("batch round[%d decks]" % d, setupBatchRounds(d)) for d in DECKS]
+
+
+def runSuite(minTime=0.2, repeats=3, only=None):
+    """Runs every benchmark, returns {name: {"value": number, "unit": unit}}"""
+    results = {}
+    for name, setup in MICRO:
+        if only and only not in name:
+            continue
+        f, ops = setup()
+        results[name] = {"value": timeIt(f, minTime, repeats)/ops*1e9, "unit": "ns/op"}
+    for name, setup in MACRO:
+        if only and only not in name:
+            continue
+        f, hands = setup()
+        results[name] = {"value": hands/timeIt(f, minTime, repeats), "unit": "hands/s"}
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """Lists (name, old, new, change) for everything more than threshold worse than the baseline"""
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old is None or old["unit"] != new["unit"]:
+            continue
+        # ns/op is better when it goes down, hands/s when it goes up
+        if new["unit"] == "ns/op":
+            change = new["value"]/old["value"] - 1
+        else:
+            change = old["value"]/new["value"] - 1
+        if change > threshold:
+            regressions.append((name, old["value"], new["value"], change))
+    return regressions
+
+
+def machine():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulator")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against the results in this file")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as " + BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.1, help="how much slower counts as a regression (0.1 = 10%%)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds to spend on each measurement")
+    parser.add_argument("--repeats", type=int, default=3, help="measurements per benchmark, the best is kept")
+    parser.add_argument("--only", help="only run benchmarks with this in their name")
+    parser.add_argument("--shuffle-table", action="store_true", help="print shuffles/sec for every shuffle mode instead")
+    args = parser.parse_args()
+
+    if args.shuffle_table:
+        decks = list(DECKS)
+        table = benchShuffle(decks, args.min_time)
+        print("shuffles per second")
+        print("%-22s" % "decks" + "".join("%12d" % d for d in decks))
+        for name, makeShoe in SHUFFLE_MODES:
+            print("%-22s" % name + "".join("%12.0f" % table[(name, d)] for d in decks))
+        sys.exit(0)
+
+    results = runSuite(args.min_time, args.repeats, args.only)
+    for name, r in results.items():
+        print("%-28s %14.1f %s" % (name, r["value"], r["unit"]))
+    for path in [args.json, BASELINE if args.save_baseline else None]:
+        if path:
+            with open(path, "w") as f:
+                json.dump({"machine": machine(), "results": results}, f, indent=1)
+    if args.baseline is None and not args.save_baseline and os.path.exists(BASELINE):
+        args.baseline = BASELINE
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print("REGRESSION %s: %.1f -> %.1f (%.0f%% worse)" % (name, old, new, change*100))
+        if regressions:
+            sys.exit(1)
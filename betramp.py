@@ -0,0 +1,158 @@
+# Trying bet ramps without playing the simulations again
+#
+# The cards that come out don't depend on what anyone bets, and a hand's net is its first
+# bet times what a one unit bet would have made (-1 lost, 1 won, 2 a natural, 3 or 5 doubled
+# down).  So if, for every counting system and every count, we know how many hands ended each
+# of those ways, any ramp's winnings are a sum over counts of bet x outcome x hands, and its
+# spread is the same with the squares.  CountHistogram collects those counts from BatchTable,
+# score() prices a ramp from them in microseconds, and search() tries every ramp that can be
+# built from a menu of bets and picks the best return whose risk of ruin is under a limit.
+#
+# Hands are filed both by true count and by running count.  The simulators step their bets up
+# the running count (cardCount), so a ramp scored by running count comes out to the winnings
+# those runs would have had with that ramp, to the dollar.  By true count it's the ramp a
+# counter dividing by the decks left would bet.  Ramps are lists like blackjack.BET_RAMP:
+# ramp[0] for a count of 1 or less, ramp[i] for a count of i+1, the last one for anything above.
+#
+# The risk of ruin is the usual formula, exp(-2 x mean x bankroll / variance), which treats
+# hands as independent.  riskofruin.py bootstraps recorded hands for a closer answer.
+#
+# python betramp.py --sims 1000 --save counts.npz                        collect, then search
+# python betramp.py --load counts.npz --bankroll 20000 --max-ruin 0.01   search again, instantly
+import argparse
+import itertools
+
+import numpy as np
+
+from batch import BatchTable
+from blackjack import BET_RAMP, SYSTEM_NAMES
+from parallel import cellRng
+
+COUNTERS = SYSTEM_NAMES[1:]      # the systems that count, seat k+1 at a table
+LIMIT = 128                      # counts are filed from -LIMIT to LIMIT-1, anything further at the ends
+COUNTS = np.arange(-LIMIT, LIMIT)
+OUTCOMES = np.arange(-1, 6)      # what a one unit bet can make, 0 and 4 never happen
+INDEXES = ["true", "running"]
+
+
+class CountHistogram:
+    """Hands by counting system, count at the time of the bet and one unit outcome
+
+    hands[index] is a (system, count, outcome) array of how many hands, for index "true" or
+    "running".  Pass record as a BatchTable's onHand."""
+
+    def __init__(self):
+        shape = (len(COUNTERS), len(COUNTS), len(OUTCOMES))
+        self.hands = {index: np.zeros(shape, dtype=np.int64) for index in INDEXES}
+
+    def record(self, hand, table):
+        unit = table.net[1:]//table.staked[1:]  # exact, the net is a whole number of first bets
+        seats = np.arange(len(COUNTERS))[:, None]
+        for index, counts in [("true", table.betTrueCount[1:]), ("running", table.betCount[1:])]:
+            where = (seats*len(COUNTS) + np.clip(counts + LIMIT, 0, len(COUNTS)-1))*len(OUTCOMES) + unit + 1
+            self.hands[index] += np.bincount(where.ravel(), minlength=self.hands[index].size).reshape(self.hands[index].shape)
+
+    def merge(self, other):
+        for index in INDEXES:
+            self.hands[index] += other.hands[index]
+
+    def moments(self, system, index="true"):
+        """For each count: hands, and the sum and sum of squares of the one unit outcomes"""
+        h = self.hands[index][COUNTERS.index(system)]
+        return h.sum(axis=1), h @ OUTCOMES, h @ (OUTCOMES*OUTCOMES)
+
+    def save(self, path):
+        np.savez(path, **self.hands)
+
+    @classmethod
+    def load(cls, path):
+        histogram = cls()
+        with np.load(path) as saved:
+            for index in INDEXES:
+                histogram.hands[index] = saved[index]
+        return histogram
+
+
+def collect(decks=range(4, 9), sims=100, seed=0, hands=200, dealerPlays=False, penetration=None, chunk=500):
+    """Plays the grid, seeded like parallel.py, and returns a CountHistogram of every counter's hands"""
+    histogram = CountHistogram()
+    cells = [(d, j) for d in decks for j in range(sims)]
+    for start in range(0, len(cells), chunk):
+        part = cells[start:start+chunk]
+        table = BatchTable([d for d, j in part], [cellRng(seed, d, j) for d, j in part], dealerPlays,
+                           penetration=penetration)
+        table.run(hands, histogram.record)
+    return histogram
+
+
+def _betsByCount(ramps):
+    # the bet each ramp (a row) makes at each count in COUNTS
+    ramps = np.atleast_2d(np.asarray(ramps, dtype=np.float64))
+    return ramps[:, np.clip(COUNTS-1, 0, ramps.shape[1]-1)]
+
+
+def _evaluate(bets, moments, bankroll):
+    n, s1, s2 = moments
+    hands = int(n.sum())
+    mean = bets @ s1/hands
+    variance = (bets*bets) @ s2/hands - mean*mean
+    with np.errstate(divide="ignore", over="ignore"):
+        ruin = np.where(mean > 0, np.minimum(np.exp(-2*mean*bankroll/variance), 1.0), 1.0)
+    return {"ev": mean, "std": np.sqrt(variance), "averageBet": bets @ n/hands, "ruin": ruin,
+            "total": bets @ s1, "hands": hands}
+
+
+def score(histogram, system, ramp, index="true", bankroll=10000):
+    """What ramp would have made for system: ev and std per hand, averageBet, ruin, total won and hands"""
+    result = _evaluate(_betsByCount(ramp)[0], histogram.moments(system, index), bankroll)
+    return {key: value.item() if isinstance(value, np.ndarray) else value for key, value in result.items()}
+
+
+def search(histogram, system, bets=range(100, 550, 50), levels=4, index="true", bankroll=10000, maxRuin=0.05):
+    """The ramp of levels steps, each a bet from bets and never going down, with the best ev
+    whose risk of ruin is at most maxRuin.  Returns (ramp, its score), or (None, None) if none is safe enough."""
+    ramps = np.array(list(itertools.combinations_with_replacement(sorted(bets), levels)))
+    result = _evaluate(_betsByCount(ramps), histogram.moments(system, index), bankroll)
+    safe = np.flatnonzero(result["ruin"] <= maxRuin)
+    if not len(safe):
+        return None, None
+    best = safe[np.argmax(result["ev"][safe])]
+    return ramps[best].tolist(), {key: value[best].item() if np.ndim(value) else value for key, value in result.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score and search counters' bet ramps from hands filed by count")
+    parser.add_argument("--load", help="a saved histogram (--save) instead of simulating")
+    parser.add_argument("--save", help="save the collected histogram here")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--penetration", type=float, default=None, help="deal this much of the shoe before reshuffling")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    parser.add_argument("--index", choices=INDEXES, default="true", help="step bets up the true or the running count")
+    parser.add_argument("--bets", type=int, nargs="+", default=list(range(100, 550, 50)), help="bets a ramp can use")
+    parser.add_argument("--levels", type=int, default=4, help="steps in a ramp")
+    parser.add_argument("--bankroll", type=int, default=10000)
+    parser.add_argument("--max-ruin", type=float, default=0.05, help="highest risk of ruin to accept")
+    args = parser.parse_args()
+
+    if args.load:
+        histogram = CountHistogram.load(args.load)
+    else:
+        histogram = collect(range(4, 9), args.sims, args.seed, args.hands, args.dealer_plays, args.penetration)
+        if args.save:
+            histogram.save(args.save)
+
+    print("system , ramp , by , ev per hand , std per hand , average bet , risk of ruin")
+    for system in COUNTERS:
+        candidates = [("BET_RAMP", BET_RAMP, "running"), ("BET_RAMP", BET_RAMP, args.index)]
+        ramp, best = search(histogram, system, args.bets, args.levels, args.index, args.bankroll, args.max_ruin)
+        rows = [(label, r, index, score(histogram, system, r, index, args.bankroll))
+                for label, r, index in candidates[:1 if args.index == "running" else 2]]
+        if ramp is not None:
+            rows.append(("best", ramp, args.index, best))
+        for label, r, index, s in rows:
+            print(system, ",", label, " ".join(map(str, r)), ",", index, ",", round(s["ev"], 3), ",",
+                  round(s["std"], 2), ",", round(s["averageBet"], 2), ",", round(s["ruin"], 4))
+        if ramp is None:
+            print(system, ", no ramp from those bets keeps the risk of ruin under", args.max_ruin)
@@ -1,5 +1,10 @@
 # Players including the dealer
+import os
 import random
+from array import array
+
+from counting import COUNTING_SYSTEMS, countHistogram, rankHistogram, trueCount
+from handstate import NEXT, TOTAL, TWO_CARDS, STAND, DOUBLE, compileStrategy, handState
 
 def total(hand):
     # A Blackjack is a special case.  It's any card with a value of 10 plus an Ace
@@ -52,14 +57,63 @@ def payout(player, dealer):
         return 2
 
 
+class BufferedSystemRandom(random.Random):
+    """Cryptographic quality random numbers like SystemRandom, but reading the OS entropy in big blocks"""
+    # SystemRandom goes to the operating system for every single number it hands out.
+    # A shuffle asks for one number per card, so we grab a few kilobytes at a time instead.
+    def __init__(self, blockSize=4096):
+        self.blockSize=blockSize
+        self.buffer=b""
+        self.position=0
+        random.Random.__init__(self)
+    
+    def seed(self, *args, **kwds):
+        """Entropy from the OS can't be seeded, so this does nothing (same as SystemRandom)"""
+        return None
+    
+    def getrandbits(self, k):
+        numBytes=(k+7)//8
+        if self.position+numBytes>len(self.buffer):
+            self.buffer=os.urandom(max(self.blockSize, numBytes))
+            self.position=0
+        chunk=self.buffer[self.position:self.position+numBytes]
+        self.position+=numBytes
+        return int.from_bytes(chunk, "big")>>(numBytes*8-k)
+    
+    def random(self):
+        return (self.getrandbits(53))*(1.0/(1<<53))
+    
+    def getstate(self):
+        raise NotImplementedError("OS entropy has no state to save")
+    
+    def setstate(self, state):
+        raise NotImplementedError("OS entropy has no state to restore")
+
 class Shoe:
     """Class that creates a shoe full of cards"""
-    def __init__(self, num=6):
-        """init method that creates a shoe object with the proper number of cards given the number of decks"""
+    # A continuous shoe (csm.CSMShoe) takes every card back before the next round, so nothing
+    # a counter has seen is still missing from it when the bets go down
+    continuous=False
+    
+    def __init__(self, num=6, rng=None, paranoid=None, penetration=None):
+        """init method that creates a shoe object with the proper number of cards given the number of decks
+        
+        rng is anything with a shuffle(list) method: random.Random, random.SystemRandom,
+        BufferedSystemRandom or a numpy Generator (PCG64, Philox...).  Pass a seeded one to get
+        the same shoes every time.  Without an rng the shoe shuffles the paranoid way it always has.
+        
+        penetration is the fraction of the shoe dealt before the cut card comes out, like 0.75.
+        The shoe is then reshuffled before the next round (see newRound) instead of running
+        out in the middle of a hand.  Without it the shoe is dealt to the last card."""
         self.numDecks=num
-        self.cards=[]
+        self.rng=rng
+        self.paranoid=(rng is None) if paranoid is None else paranoid
         self.refill=False
+        self.profiler=None  # an instrument.Profiler to tell about shuffles and refills
         
+        # The cards live in one byte each, and are dealt from the end by moving cardsLeft down.
+        # Nothing is ever removed, so reshuffling is just shuffling the same array again.
+        self.cards=array("b")
         for k in range(0, self.numDecks):
             for i in ["diamonds","clubs","hearts","spades"]:  # not relevant to blackjack, so we're not going to store it
                                                               # just use it for generation
@@ -67,35 +121,90 @@ class Shoe:
                                                               # Players will know better, of course.  Just a placeholder
                 for j in [11, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10]:  # Values are all that matter since I'm not implementing splitting
                     self.cards.append(j)
+        if penetration is None:
+            self.cutCard=0
+        else:
+            self.cutCard=int(round(len(self.cards)*(1-penetration)))  # cards left when the cut card comes out
+        self.fill()
+    
+    def fill(self):
+        """Puts all the cards back in the shoe"""
+        # What's left in the shoe is kept up to date as cards are dealt, so nobody has to
+        # walk the whole shoe to find out.  rankCounts is indexed by card value, ace is 11.
+        self.rankCounts=[0, 0]+[4*self.numDecks]*8+[16*self.numDecks, 4*self.numDecks]
+        self.cardsLeft=len(self.cards)
+        self.pipTotal=380*self.numDecks
     
     def getShoe(self):
-        """Returns the list of cards left"""
-        return self.cards
+        """Returns the cards left, the next one to be dealt is last"""
+        return self.cards[:self.cardsLeft]
+    
+    def composition(self):
+        """Returns a snapshot of what's left: count of each card value (index 2 to 11), cards left and their pip total"""
+        return list(self.rankCounts), self.cardsLeft, self.pipTotal
     
     def shuffle(self):
+        """Shuffles the cards, either once with the shoe's generator or the paranoid way"""
+        if self.paranoid:
+            self.paranoidShuffle()
+        elif hasattr(self.rng, "bit_generator"):
+            # numpy generators are a lot quicker when they can see the bytes as an array
+            import numpy
+            self.rng.shuffle(numpy.frombuffer(self.cards, dtype=numpy.int8))
+        else:
+            # A single Fisher-Yates pass already picks every ordering with equal chance,
+            # as long as the generator is good.  Shuffling it again doesn't add anything.
+            cards=self.cards.tolist()
+            self.rng.shuffle(cards)
+            self.cards[:]=array("b", cards)
+    
+    def paranoidShuffle(self):
         """uses the cryptographic quality random number generator to shuffle the cards"""
         # In a six deck shoe, there are 312! permutations
         # The regular random number generator might produce
         # up to 2 to the 64th power pseudorandom numbers
         # before it repeats.  So I have to use the cryptopgraphic
         # quality random generator
-        shuffler=random.SystemRandom()
+        # A paranoid shoe given an rng uses it instead, so it needs a randint() like random.Random's
+        shuffler=self.rng if self.rng is not None else random.SystemRandom()
         
+        cards=self.cards.tolist()  # a list is much quicker to shuffle this many times
         for i in range(0, shuffler.randint(4*self.numDecks, 8*self.numDecks)):  # shuffle random number of times
-            shuffler.shuffle(self.cards)
+            shuffler.shuffle(cards)
+        self.cards[:]=array("b", cards)
+    
+    def reshuffle(self):
+        """Gathers all the cards up and shuffles them"""
+        self.fill()
+        if self.profiler is not None:
+            self.profiler.timeEvent("shuffle", self.shuffle)
+        else:
+            self.shuffle()
+        self.refill=True
+    
+    def newRound(self):
+        """Called before each round is dealt.  Reshuffles if the cut card has come out."""
+        if self.cardsLeft<=self.cutCard:
+            if self.profiler is not None:
+                self.profiler.count("cut card reshuffles")
+            self.reshuffle()
     
     def deal(self, num):
         """deals num cards from deck"""
         
         # if there aren't enough cards, let's refill the shoe
-        if num>len(self.cards):
-            self.__init__(self.numDecks)
-            self.shuffle()
-            self.refill=True
-        l=[]
+        if num>self.cardsLeft:
+            if self.profiler is not None:
+                self.profiler.count("refills")
+            self.reshuffle()
         
-        for i in range(0,num):
-            l.append(self.cards.pop())
+        end=self.cardsLeft
+        self.cardsLeft=end-num
+        l=self.cards[self.cardsLeft:end]
+        l.reverse()  # dealt from the end, last card first
+        for card in l:
+            self.rankCounts[card]-=1
+            self.pipTotal-=card
         
         return l
 
@@ -114,40 +223,59 @@ class Dealer:
     
     def play(self, shoe):
         """The dealer plays the standard dealer algorithm.  Hit at 17 or below, otherwise stay"""
+        state=handState(self.cards)
         while True:
-            self.total=total(self.cards)
+            self.total=TOTAL[state]
             if self.total==-1:
                 break
             if self.total<17:
-                self.cards.append(shoe.deal(1)[0])
+                card=shoe.deal(1)[0]
+                self.cards.append(card)
+                state=NEXT[state][card]
             else:
                 break
     def clearHand (self):
         self.cards=[]
         self.total=0
 
+# General strategy for hard totals 8 to 16, see Player.play
+# Dealer Card      A     2    3    4    5    6    7    8    9    10
+BET_PLAY_MATRIX=[["H", "H", "H", "H", "D", "D", "H", "H", "H", "H"],     # player hand 8
+                 ["H", "D", "D", "D", "D", "D", "H", "H", "H", "H"],     # player hand 9
+                 ["H", "D", "D", "D", "D", "D", "D", "D", "D", "H"],     # player hand 10
+                 ["D", "D", "D", "D", "D", "D", "D", "D", "D", "D"],     # player hand 11
+                 ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 12
+                 ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 13
+                 ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 14
+                 ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 15
+                 ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"]]     # player hand 16
+
+# What a counter bets for a running count of 1 or less, 2, 3, and 4 or more.  A longer ramp
+# keeps going up one step per point of count.
+BET_RAMP=[100, 150, 200, 300]
+
 # Players using progressive betting
 class Player:
     """A standard player who uses progressive betting"""
     
+    # Everyone plays the same matrix, so it lives on the class.  strategy is the same thing
+    # compiled down to a lookup on the hand's state, strategy[state][dealer card].  Giving a
+    # player a different one (from compileStrategy, or strategy.strategyFor) changes how
+    # they play.
+    betPlayMatrix=BET_PLAY_MATRIX
+    strategy=compileStrategy(BET_PLAY_MATRIX)
+    
     def __init__(self):
         self.level=1
         self.totalMoney=10000  # The initial amount of cash
-        # Dealer Card        A     2    3    4    5    6    7    8    9    10
-        self.betPlayMatrix=[["H", "H", "H", "H", "D", "D", "H", "H", "H", "H"],     # player hand 8
-                            ["H", "D", "D", "D", "D", "D", "H", "H", "H", "H"],     # player hand 9
-                            ["H", "D", "D", "D", "D", "D", "D", "D", "D", "H"],     # player hand 10
-                            ["D", "D", "D", "D", "D", "D", "D", "D", "D", "D"],     # player hand 11
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 12
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 13
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 14
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 15
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"]]     # player hand 16
     def dealToSelf(self, shoe):
         self.cards=shoe.deal(2)
-    def play(self, shoe, dealerCard):
+    def placeBet(self, shoe):
         self.bet=100*self.level
+    def play(self, shoe, dealerCard):
+        self.placeBet(shoe)
         self.totalMoney=self.totalMoney-self.bet
+        self.doubled=False
         # player will use general strategy without splitting, with Doubling Down allowed
         # on all card combinations.  Soft combinations will be ignored for the sake
         # of simplicity.
@@ -158,409 +286,191 @@ class Player:
         # See "Optimum Zero-Memory Strategy and Exact Probabilities for 4-Deck Blackjack"
         # by A.R. Manson et al., 1975
         # print "--START PLAYER TURN--"
-        whatToDo=""
-        while whatToDo!="S":
-           self.total=total(self.cards)
-           if self.total==-1 or self.total>16:
-               whatToDo="S"
-           elif self.total<8:
-               whatToDo="H"   # hit me
-           elif self.total>7:
-               if dealerCard==11:
-                   x=1
-               else:
-                   x=dealerCard
-               
-               whatToDo=self.betPlayMatrix[self.total-8][x-1]
-           
-           if whatToDo=="D" and len(self.cards)==2:
-               self.cards.append(shoe.deal(1)[0])  # Double down, hit me
+        # The hand is kept as a state number from handstate, so taking a card, the total and
+        # what to do next are all just table lookups.
+        state=handState(self.cards)
+        while True:
+           self.total=TOTAL[state]
+           whatToDo=self.strategy[state][dealerCard]
+           if whatToDo==DOUBLE and not TWO_CARDS[state]:
+               whatToDo=STAND  # you can only double on two cards, whatever the strategy says
+           if whatToDo==STAND:
+               break
+           card=shoe.deal(1)[0]  # hit me
+           self.cards.append(card)
+           state=NEXT[state][card]
+           if whatToDo==DOUBLE:
+               # Double down.  Note the total isn't looked at again, so payout sees the
+               # total from before this card.  That's how it's always worked.
                self.bet=self.bet*2
-               whatToDo="S"
-           if whatToDo=="D" and len(self.cards)>2:
-               whatToDo="S"
-           if whatToDo=="H":
-               self.cards.append(shoe.deal(1)[0])
+               self.doubled=True
+               break
+        self.state=state
 
-# Thresholds +3, +4, +5 for Hi-Lo
-
-class HiLoPlayer:
-    """A Player using High Low Card Counting"""
+class CountingPlayer(Player):
+    """A Player who counts cards with one of the systems in counting.COUNTING_SYSTEMS and bets on the count"""
     
     # All players use the same strategy.  The card counting is about betting
-    # not strategy.
-    def __init__(self):
-        self.level=1
-        self.totalMoney=10000  # The initial amount of cash
+    # not strategy.  The only thing that changes from one counter to the next is
+    # the tag each card gets, which is looked up by the name of the system.
+    system=None
+    
+    def __init__(self, system=None, betRamp=None):
+        Player.__init__(self)
+        if system is not None:
+            self.system=system
+        self.betRamp=BET_RAMP if betRamp is None else betRamp
+        self.tags=COUNTING_SYSTEMS[self.system]
         self.cardCount=0
         self.actualCount=0   # count when we compensate for number of cards left in the shoe
-        # Dealer Card        A     2    3    4    5    6    7    8    9    10
-        self.betPlayMatrix=[["H", "H", "H", "H", "D", "D", "H", "H", "H", "H"],     # player hand 8
-                            ["H", "D", "D", "D", "D", "D", "H", "H", "H", "H"],     # player hand 9
-                            ["H", "D", "D", "D", "D", "D", "D", "D", "D", "H"],     # player hand 10
-                            ["D", "D", "D", "D", "D", "D", "D", "D", "D", "D"],     # player hand 11
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 12
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 13
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 14
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 15
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"]]     # player hand 16
-    def dealToSelf(self, shoe):
-        self.cards=shoe.deal(2)
     
     def countCard(self, cardsTable, shoe):
-        """When passed a list of all cards on the table, will count using high/low card counting system"""
-        for i in cardsTable:
-             if i>1 and i<7:
-                 self.cardCount=self.cardCount+1
-             if i>9:
-                 self.cardCount=self.cardCount-1
-        
-        # We need to vary this based on the number of dekcs left in the shoe.  Problem is
-        # in real life, no one can know the exact number of cards left in the shoe.
-        # Real players guess, and then they fudge a bit based on circumstances.  Since
-        # the computer can't fudge based on circumstances, we'll let it get the exact
-        # number of cards in the shoe to compensate for human intuition.
-        
+        """When passed a list of all cards on the table, will count them using the player's system"""
+        self.addCount(countHistogram(self.tags, rankHistogram(cardsTable)), shoe)
+    
+    def addCount(self, change, shoe):
+        """Adds to the running count and works out the true count for what's left in the shoe"""
+        self.cardCount=self.cardCount+change
         # There's a slight chance there are no more cards in the shoe.  If so, we shouldn't
         # divide by zero
-        if sum(shoe.cards)>0:
-             self.actualCount=int(round(self.cardCount/(sum(shoe.cards)/52.0)))
+        if shoe.pipTotal>0:
+             self.actualCount=trueCount(self.cardCount, shoe)
         else:
-	         self.cardCount=0  # because if there's no more cards left, we start over anyhow
-	         self.actualCount=0
-    def play(self, shoe, dealerCard):
-        if shoe.refill:
-             shoe.refill=False
-             self.cardCount=0
+             self.cardCount=0  # because if there's no more cards left, we start over anyhow
              self.actualCount=0
-        if self.cardCount<2:
-            self.bet=100
-        elif self.cardCount==2:
-            self.bet=150
-        elif self.cardCount==3:
-            self.bet=200
-        elif self.cardCount>3:
-            self.bet=300
-        self.totalMoney=self.totalMoney-self.bet
-        # print self.cardCount
-        #if self.actualCount>1 or self.actualCount<-1:
-        #    print self.actualCount
-
-        # player will use general strategy without splitting, with Doubling Down allowed
-        # on all card combinations.  Soft combinations will be ignored for the sake
-        # of simplicity.
-        
-        # Look at the dealer card.  Then decide to hit, stay, or double down
-        # Except for double down, keep doing this until you bust, get 21 or
-        # where the odds are against you based on general strategy for a 4-6 deck game
-        whatToDo=""
-        while whatToDo!="S":
-           self.total=total(self.cards)
-           if self.total==-1 or self.total>16:
-               whatToDo="S"
-           elif self.total<8:
-               whatToDo="H"   # hit me
-           elif self.total>7:
-               if dealerCard==11:
-                   x=1
-               else:
-                   x=dealerCard
-               
-               whatToDo=self.betPlayMatrix[self.total-8][x-1]
-           
-           if whatToDo=="D" and len(self.cards)==2:
-               self.cards.append(shoe.deal(1)[0])  # Double down, hit me
-               self.bet=self.bet*2
-               whatToDo="S"
-           if whatToDo=="D" and len(self.cards)>2:
-               whatToDo="S"
-           if whatToDo=="H":
-               self.cards.append(shoe.deal(1)[0])
-
-class KOPlayer:
-    """A Player using KO Card Counting"""
-
-    # All players use the same strategy.  The card counting is about betting
-    # not strategy.
-    def __init__(self):
-        self.level=1
-        self.totalMoney=10000  # The initial amount of cash
-        self.cardCount=0
-        self.actualCount=0   # count when we compensate for number of cards left in the shoe
-        # Dealer Card        A     2    3    4    5    6    7    8    9    10
-        self.betPlayMatrix=[["H", "H", "H", "H", "D", "D", "H", "H", "H", "H"],     # player hand 8
-                            ["H", "D", "D", "D", "D", "D", "H", "H", "H", "H"],     # player hand 9
-                            ["H", "D", "D", "D", "D", "D", "D", "D", "D", "H"],     # player hand 10
-                            ["D", "D", "D", "D", "D", "D", "D", "D", "D", "D"],     # player hand 11
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 12
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 13
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 14
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 15
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"]]     # player hand 16
-    def dealToSelf(self, shoe):
-        self.cards=shoe.deal(2)
-
-    def countCard(self, cardsTable, shoe):
-        """When passed a list of all cards on the table, will count using KO card counting system"""
-        for i in cardsTable:
-             if i>1 and i<8:
-                 self.cardCount=self.cardCount+1
-             if i>9:
-                 self.cardCount=self.cardCount-1
-
-        # We need to vary this based on the number of dekcs left in the shoe.  Problem is
-        # in real life, no one can know the exact number of cards left in the shoe.
-        # Real players guess, and then they fudge a bit based on circumstances.  Since
-        # the computer can't fudge based on circumstances, we'll let it get the exact
-        # number of cards in the shoe to compensate for human intuition.
-
-        # There's a slight chance there are no more cards in the shoe.  If so, we shouldn't
-        # divide by zero
-        if sum(shoe.cards)>0:
-             self.actualCount=int(round(self.cardCount/(sum(shoe.cards)/52.0)))
-        else:
-	         self.cardCount=0  # because if there's no more cards left, we start over anyhow
-	         self.actualCount=0
-    def play(self, shoe, dealerCard):
+    
+    def placeBet(self, shoe):
         if shoe.refill:
              shoe.refill=False
              self.cardCount=0
              self.actualCount=0
-        if self.cardCount<2:
-            self.bet=100
-        elif self.cardCount==2:
-            self.bet=150
-        elif self.cardCount==3:
-            self.bet=200
-        elif self.cardCount>3:
-            self.bet=300
-        self.totalMoney=self.totalMoney-self.bet
+        elif shoe.continuous:
+             self.cardCount=0  # the cards it counted are back in the shoe
+             self.actualCount=0
+        # 100 up to a count of 1, then one step up the ramp for each point of count (100/150/200/300)
+        self.bet=self.betRamp[min(max(self.cardCount-1, 0), len(self.betRamp)-1)]
         # print self.cardCount
         #if self.actualCount>1 or self.actualCount<-1:
         #    print self.actualCount
 
-        # player will use general strategy without splitting, with Doubling Down allowed
-        # on all card combinations.  Soft combinations will be ignored for the sake
-        # of simplicity.
+def countRound(counters, shoe, *hands):
+    """Counts the cards from a round for every counting player, looking at each card only once"""
+    seen=rankHistogram(*hands)
+    for counter in counters:
+        counter.addCount(countHistogram(counter.tags, seen), shoe)
 
-        # Look at the dealer card.  Then decide to hit, stay, or double down
-        # Except for double down, keep doing this until you bust, get 21 or
-        # where the odds are against you based on general strategy for a 4-6 deck game
-        whatToDo=""
-        while whatToDo!="S":
-           self.total=total(self.cards)
-           if self.total==-1 or self.total>16:
-               whatToDo="S"
-           elif self.total<8:
-               whatToDo="H"   # hit me
-           elif self.total>7:
-               if dealerCard==11:
-                   x=1
-               else:
-                   x=dealerCard
+# Thresholds +3, +4, +5 for Hi-Lo
 
-               whatToDo=self.betPlayMatrix[self.total-8][x-1]
+class HiLoPlayer(CountingPlayer):
+    """A Player using High Low Card Counting"""
+    system="HiLo"
 
-           if whatToDo=="D" and len(self.cards)==2:
-               self.cards.append(shoe.deal(1)[0])  # Double down, hit me
-               self.bet=self.bet*2
-               whatToDo="S"
-           if whatToDo=="D" and len(self.cards)>2:
-               whatToDo="S"
-           if whatToDo=="H":
-               self.cards.append(shoe.deal(1)[0])
+class KOPlayer(CountingPlayer):
+    """A Player using KO Card Counting"""
+    system="KO"
 
-class HiOptPlayer:
+class HiOptPlayer(CountingPlayer):
     """A Player using High Opt 2 Counting"""
+    system="hiOpt"
 
-    # All players use the same strategy.  The card counting is about betting
-    # not strategy.
-    def __init__(self):
-        self.level=1
-        self.totalMoney=10000  # The initial amount of cash
-        self.cardCount=0
-        self.actualCount=0   # count when we compensate for number of cards left in the shoe
-        # Dealer Card        A     2    3    4    5    6    7    8    9    10
-        self.betPlayMatrix=[["H", "H", "H", "H", "D", "D", "H", "H", "H", "H"],     # player hand 8
-                            ["H", "D", "D", "D", "D", "D", "H", "H", "H", "H"],     # player hand 9
-                            ["H", "D", "D", "D", "D", "D", "D", "D", "D", "H"],     # player hand 10
-                            ["D", "D", "D", "D", "D", "D", "D", "D", "D", "D"],     # player hand 11
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 12
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 13
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 14
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 15
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"]]     # player hand 16
-    def dealToSelf(self, shoe):
-        self.cards=shoe.deal(2)
-
-    def countCard(self, cardsTable, shoe):
-        """When passed a list of all cards on the table, will count using Hi-Opt II card counting system"""
-        for i in cardsTable:
-             if i==4 or i==5:
-                 self.cardCount=self.cardCount+2
-             if i in [2, 3, 6, 7]:
-                 self.cardCount=self.cardCount+1
-             if i>9 and i<11:
-                 self.cardCount=self.cardCount-2
-
-        # We need to vary this based on the number of decks left in the shoe.  Problem is
-        # in real life, no one can know the exact number of cards left in the shoe.
-        # Real players guess, and then they fudge a bit based on circumstances.  Since
-        # the computer can't fudge based on circumstances, we'll let it get the exact
-        # number of cards in the shoe to compensate for human intuition.
-
-        # There's a slight chance there are no more cards in the shoe.  If so, we shouldn't
-        # divide by zero
-        if sum(shoe.cards)>0:
-             self.actualCount=int(round(self.cardCount/(sum(shoe.cards)/52.0)))
-        else:
-	         self.cardCount=0  # because if there's no more cards left, we start over anyhow
-	         self.actualCount=0
-    def play(self, shoe, dealerCard):
-        if shoe.refill:
-             shoe.refill=False
-             self.cardCount=0
-             self.actualCount=0
-        if self.cardCount<2:
-            self.bet=100
-        elif self.cardCount==2:
-            self.bet=150
-        elif self.cardCount==3:
-            self.bet=200
-        elif self.cardCount>3:
-            self.bet=300
-        self.totalMoney=self.totalMoney-self.bet
-        # print self.cardCount
-        #if self.actualCount>1 or self.actualCount<-1:
-        #    print self.actualCount
-
-        # player will use general strategy without splitting, with Doubling Down allowed
-        # on all card combinations.  Soft combinations will be ignored for the sake
-        # of simplicity.
-
-        # Look at the dealer card.  Then decide to hit, stay, or double down
-        # Except for double down, keep doing this until you bust, get 21 or
-        # where the odds are against you based on general strategy for a 4-6 deck game
-        whatToDo=""
-        while whatToDo!="S":
-           self.total=total(self.cards)
-           if self.total==-1 or self.total>16:
-               whatToDo="S"
-           elif self.total<8:
-               whatToDo="H"   # hit me
-           elif self.total>7:
-               if dealerCard==11:
-                   x=1
-               else:
-                   x=dealerCard
-
-               whatToDo=self.betPlayMatrix[self.total-8][x-1]
-
-           if whatToDo=="D" and len(self.cards)==2:
-               self.cards.append(shoe.deal(1)[0])  # Double down, hit me
-               self.bet=self.bet*2
-               whatToDo="S"
-           if whatToDo=="D" and len(self.cards)>2:
-               whatToDo="S"
-           if whatToDo=="H":
-               self.cards.append(shoe.deal(1)[0])
-
-class ZenPlayer:
+class ZenPlayer(CountingPlayer):
     """A Player using The Zen Counting System found at http://www.blackjackforumonline.com/content/hundred.htm"""
+    system="Zen"
 
-    # All players use the same strategy.  The card counting is about betting
-    # not strategy.
-    def __init__(self):
-        self.level=1
-        self.totalMoney=10000  # The initial amount of cash
-        self.cardCount=0
-        self.actualCount=0   # count when we compensate for number of cards left in the shoe
-        # Dealer Card        A     2    3    4    5    6    7    8    9    10
-        self.betPlayMatrix=[["H", "H", "H", "H", "D", "D", "H", "H", "H", "H"],     # player hand 8
-                            ["H", "D", "D", "D", "D", "D", "H", "H", "H", "H"],     # player hand 9
-                            ["H", "D", "D", "D", "D", "D", "D", "D", "D", "H"],     # player hand 10
-                            ["D", "D", "D", "D", "D", "D", "D", "D", "D", "D"],     # player hand 11
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 12
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 13
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 14
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"],     # player hand 15
-                            ["H", "H", "H", "S", "S", "S", "H", "H", "H", "H"]]     # player hand 16
-    def dealToSelf(self, shoe):
-        self.cards=shoe.deal(2)
-
-    def countCard(self, cardsTable, shoe):
-        """When passed a list of all cards on the table, will count using zen card counting system"""
-        for i in cardsTable:
-             if i==11:
-                 self.cardCount=self.cardCount-1
-             if i in [2, 3, 7]:
-                 self.cardCount=self.cardCount+1
-             if i in [4, 5, 6]:
-                 self.cardCount=self.cardCount+2
-             if i==10:
-                 self.cardCount=self.cardCount-2
-        # We need to vary this based on the number of decks left in the shoe.  Problem is
-        # in real life, no one can know the exact number of cards left in the shoe.
-        # Real players guess, and then they fudge a bit based on circumstances.  Since
-        # the computer can't fudge based on circumstances, we'll let it get the exact
-        # number of cards in the shoe to compensate for human intuition.
 
-        # There's a slight chance there are no more cards in the shoe.  If so, we shouldn't
-        # divide by zero
-        if sum(shoe.cards)>0:
-             self.actualCount=int(round(self.cardCount/(sum(shoe.cards)/52.0)))
-        else:
-	         self.cardCount=0  # because if there's no more cards left, we start over anyhow
-	         self.actualCount=0
-    def play(self, shoe, dealerCard):
-        if shoe.refill:
-             shoe.refill=False
-             self.cardCount=0
-             self.actualCount=0
-        if self.cardCount<2:
-            self.bet=100
-        elif self.cardCount==2:
-            self.bet=150
-        elif self.cardCount==3:
-            self.bet=200
-        elif self.cardCount>3:
-            self.bet=300
-        self.totalMoney=self.totalMoney-self.bet
-        # print self.cardCount
-        #if self.actualCount>1 or self.actualCount<-1:
-        #    print self.actualCount
+# Labels used in the output rows, in the order the players sit at the table
+SYSTEM_NAMES=["none", "HiLo", "KO", "hiOpt", "Zen"]
 
-        # player will use general strategy without splitting, with Doubling Down allowed
-        # on all card combinations.  Soft combinations will be ignored for the sake
-        # of simplicity.
-
-        # Look at the dealer card.  Then decide to hit, stay, or double down
-        # Except for double down, keep doing this until you bust, get 21 or
-        # where the odds are against you based on general strategy for a 4-6 deck game
-        whatToDo=""
-        while whatToDo!="S":
-           self.total=total(self.cards)
-           if self.total==-1 or self.total>16:
-               whatToDo="S"
-           elif self.total<8:
-               whatToDo="H"   # hit me
-           elif self.total>7:
-               if dealerCard==11:
-                   x=1
-               else:
-                   x=dealerCard
-
-               whatToDo=self.betPlayMatrix[self.total-8][x-1]
-
-           if whatToDo=="D" and len(self.cards)==2:
-               self.cards.append(shoe.deal(1)[0])  # Double down, hit me
-               self.bet=self.bet*2
-               whatToDo="S"
-           if whatToDo=="D" and len(self.cards)>2:
-               whatToDo="S"
-           if whatToDo=="H":
-               self.cards.append(shoe.deal(1)[0])
+class Table:
+    """The dealer and the five players sitting at one shoe"""
+    
+    def __init__(self, shoe, dealerPlays=False, profiler=None, betRamp=None, strategy=None):
+        # The original driver never let the dealer take his turn, so his total stays at 0 and
+        # every hand that doesn't bust is paid as a win.  That's what generated the published data,
+        # so it's still the default.  dealerPlays=True runs the dealer's hit below 17 algorithm.
+        #
+        # profiler is an optional instrument.Profiler that gets the time spent in each phase.
+        # betRamp is what the counters bet as their count goes up, BET_RAMP by default.
+        # strategy replaces everyone's Player.strategy, like a table from strategy.strategyFor.
+        self.shoe=shoe
+        self.dealerPlays=dealerPlays
+        self.profiler=profiler
+        if profiler is not None:
+            shoe.profiler=profiler
+        self.handsPlayed=0
+        self.dealer=Dealer()
+        self.normPlayer=Player()  # a player using strategy, but no card counting
+        self.hiLo=HiLoPlayer(betRamp=betRamp)    # a player using High/Low Counting
+        self.KO=KOPlayer(betRamp=betRamp)        # a player using KO Counting
+        self.hiOpt=HiOptPlayer(betRamp=betRamp)  # a player using Hi-Opt II Counting
+        self.zen=ZenPlayer(betRamp=betRamp)      # a player using Zen Counting
+        self.players=[self.normPlayer, self.hiLo, self.KO, self.hiOpt, self.zen]  # in the order of SYSTEM_NAMES
+        if strategy is not None:
+            for player in self.players:
+                player.strategy=strategy
+    
+    def playHand(self):
+        """Plays one hand"""
+        shoe, dealer, profiler=self.shoe, self.dealer, self.profiler
+        normPlayer, hiLo, KO, hiOpt, zen=self.players
+        
+        # DEAL
+        if profiler is not None:
+            profiler.start("DEAL")
+        shoe.newRound()
+        normPlayer.dealToSelf(shoe)
+        hiLo.dealToSelf(shoe)
+        KO.dealToSelf(shoe)
+        hiOpt.dealToSelf(shoe)
+        zen.dealToSelf(shoe)
+        dealer.dealToSelf(shoe)
+        
+        # PLAY
+        if profiler is not None:
+            profiler.start("PLAY")
+        normPlayer.play(shoe, dealer.showCard)
+        hiLo.play(shoe, dealer.showCard)
+        KO.play(shoe, dealer.showCard)
+        hiOpt.play(shoe, dealer.showCard)
+        zen.play(shoe, dealer.showCard)
+        if self.dealerPlays:
+            dealer.play(shoe)
+        
+        # RESOLVE HAND
+        if profiler is not None:
+            profiler.start("RESOLVE HAND")
+        normPlayer.totalMoney=normPlayer.totalMoney+normPlayer.bet*payout(normPlayer, dealer)
+        hiLo.totalMoney=hiLo.totalMoney+hiLo.bet*payout(hiLo, dealer)
+        KO.totalMoney=KO.totalMoney+KO.bet*payout(KO, dealer)
+        hiOpt.totalMoney=hiOpt.totalMoney+hiOpt.bet*payout(hiOpt, dealer)
+        zen.totalMoney=zen.totalMoney+zen.bet*payout(zen, dealer)
+        
+        # COUNT CARDS, everything on the table in one pass for all the counters
+        if profiler is not None:
+            profiler.start("COUNT CARDS")
+        countRound([hiLo, KO, hiOpt, zen], shoe, normPlayer.cards, hiLo.cards, KO.cards,
+                   hiOpt.cards, zen.cards, dealer.cards)
+        self.handsPlayed=self.handsPlayed+1
+        
+        if profiler is not None:
+            profiler.stop()
+            profiler.count("hands")
+            profiler.count("cards dealt", sum(len(p.cards) for p in self.players)+len(dealer.cards))
+            profiler.count("doubles", sum(p.doubled for p in self.players))
+            # from the total payout looked at, so a double that drew too much isn't a bust
+            profiler.count("busts", sum(p.total>21 for p in self.players))
+            profiler.count("dealer hits", len(dealer.cards)-2)
+    
+    def winnings(self):
+        """How much each player has won so far, in the order of SYSTEM_NAMES"""
+        return [p.totalMoney-10000 for p in self.players]
 
+def runSimulation(shoe, hands=200, dealerPlays=False, profiler=None, betRamp=None, strategy=None):
+    """Plays a number of hands at a table of the five players and returns how much each one won"""
+    table=Table(shoe, dealerPlays, profiler, betRamp, strategy)
+    for k in range (0, hands):  # a loop for 200 hands per simulation, about 2-3 hours worth at a table
+        table.playHand()
+    return table.winnings()
 
 
 if __name__=="__main__":
@@ -582,63 +492,17 @@ if __name__=="__main__":
     # too much, though, and stick to 100 for each number of decks between 4 and 8
     
     
+    # python blackjack.py --profile  also prints where the time went, on stderr
+    import sys
+    from instrument import Profiler
+    profiler=Profiler() if "--profile" in sys.argv else None
+    
     for i in range(4, 9):             # a loop for numbers of decks in the shoe between 4 and 8
         for j in range(0, 100):       # a loop for 100 simulations
-                
-                shoe=Shoe(i)
-                dealer=Dealer()
-                normPlayer=Player()  # a player using strategy, but no card counting
-                hiLo=HiLoPlayer()    # a player using High/Low Counting
-                KO=KOPlayer()        # a player using KO Counting
-                hiOpt=HiOptPlayer()  # a player using Hi-Opt II Counting
-                zen=ZenPlayer()      # a player using Zen Counting
-                
-                for k in range (0, 200):  # a loop for 200 hands per simulation, about 2-3 hours worth at a table
-                    # DEAL
-                    normPlayer.dealToSelf(shoe)
-                    hiLo.dealToSelf(shoe)
-                    KO.dealToSelf(shoe)
-                    hiOpt.dealToSelf(shoe)
-                    zen.dealToSelf(shoe)
-                    dealer.dealToSelf(shoe)
-                    
-                    # PLAY
-                    normPlayer.play(shoe, dealer.showCard)
-                    hiLo.play(shoe, dealer.showCard)
-                    KO.play(shoe, dealer.showCard)
-                    hiOpt.play(shoe, dealer.showCard)
-                    zen.play(shoe, dealer.showCard)
-                    
-                    # RESOLVE HAND
-                    normPlayer.totalMoney=normPlayer.totalMoney+normPlayer.bet*payout(normPlayer, dealer)
-                    hiLo.totalMoney=hiLo.totalMoney+hiLo.bet*payout(hiLo, dealer)
-                    KO.totalMoney=KO.totalMoney+KO.bet*payout(KO, dealer)
-                    hiOpt.totalMoney=hiOpt.totalMoney+hiOpt.bet*payout(hiOpt, dealer)
-                    zen.totalMoney=zen.totalMoney+zen.bet*payout(zen, dealer)
-                    
-                    # GRAB A LIST OF CARDS ON TABLE FOR COUNTING
-                    tableCards=[]
-                    for l in normPlayer.cards:
-                        tableCards.append(l)
-                    for l in hiLo.cards:
-                        tableCards.append(l)
-                    for l in KO.cards:
-                         tableCards.append(l)
-                    for l in hiOpt.cards:
-                         tableCards.append(l)
-                    for l in zen.cards:
-                         tableCards.append(l)
-                    for l in dealer.cards:
-                        tableCards.append(l)
-                    
-                    # COUNT CARDS
-                    hiLo.countCard(tableCards, shoe)
-                    KO.countCard(tableCards, shoe)
-                    hiOpt.countCard(tableCards, shoe)
-                    zen.countCard(tableCards, shoe)
+                winnings=runSimulation(Shoe(i), profiler=profiler)
                 # print "Simulation ",j+1," with ", i, "decks in the shoe"
-                print normPlayer.totalMoney-10000,",",i,",","none"
-                print hiLo.totalMoney-10000,",", i,",","HiLo"
-                print KO.totalMoney-10000,",",i,",","KO"
-                print hiOpt.totalMoney-10000,",",i,",","hiOpt"
-                print zen.totalMoney-10000,",",i,",","Zen"
+                for won, name in zip(winnings, SYSTEM_NAMES):
+                    print(won, ",", i, ",", name)
+    
+    if profiler is not None:
+        profiler.dump()
@@ -0,0 +1,188 @@
+# Long sweeps that can be stopped and picked up again
+#
+# The sweep plays the same decks x simulations grid as blackjack.py, one Table at a time,
+# with every cell's shoe seeded from (seed, decks, simulation) like parallel.py (the numbers
+# differ from parallel.py's, since the loop shuffles its shoe its own way).  Every so
+# often the whole state of the run is written to a checkpoint file: the winnings of every
+# finished cell, and for the cell being played, the shoe (cards, where we are in it, its
+# random generator), each player's bankroll and count, and how many hands have been played.
+#
+# python checkpoint.py --seed 7 --checkpoint sweep.json            start a sweep
+# python checkpoint.py --seed 7 --checkpoint sweep.json --resume   carry on after it was stopped
+#
+# The output of a resumed run is the same as if it had never stopped.
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from blackjack import SYSTEM_NAMES, Shoe, Table
+from parallel import cellRng
+
+VERSION = 1
+
+
+def rngState(rng):
+    """The state of a numpy Generator or random.Random, in a form json can write"""
+    if hasattr(rng, "bit_generator"):
+        return {"kind": "numpy", "state": rng.bit_generator.state}
+    if type(rng) is random.Random:
+        version, internal, gauss = rng.getstate()
+        return {"kind": "random", "state": [version, list(internal), gauss]}
+    # OS entropy has no state, so there'd be no way to deal the same cards again
+    raise ValueError("can't checkpoint a shoe shuffled with %s" % type(rng).__name__)
+
+
+def restoreRng(saved):
+    if saved["kind"] == "numpy":
+        bitGenerator = getattr(np.random, saved["state"]["bit_generator"])()
+        bitGenerator.state = saved["state"]
+        return np.random.Generator(bitGenerator)
+    version, internal, gauss = saved["state"]
+    rng = random.Random()
+    rng.setstate((version, tuple(internal), gauss))
+    return rng
+
+
+def shoeState(shoe):
+    return {"decks": shoe.numDecks,
+            "cards": base64.b64encode(shoe.cards.tobytes()).decode("ascii"),
+            "cardsLeft": shoe.cardsLeft,
+            "rankCounts": list(shoe.rankCounts),
+            "pipTotal": shoe.pipTotal,
+            "refill": shoe.refill,
+            "cutCard": shoe.cutCard,
+            "paranoid": shoe.paranoid,
+            "rng": rngState(shoe.rng)}
+
+
+def restoreShoe(saved):
+    shoe = Shoe(saved["decks"], restoreRng(saved["rng"]), saved["paranoid"])
+    shoe.cards[:] = array("b", base64.b64decode(saved["cards"]))
+    shoe.cardsLeft = saved["cardsLeft"]
+    shoe.rankCounts = list(saved["rankCounts"])
+    shoe.pipTotal = saved["pipTotal"]
+    shoe.refill = saved["refill"]
+    shoe.cutCard = saved["cutCard"]
+    return shoe
+
+
+def tableState(table):
+    """Everything about a Table that carries over from one hand to the next"""
+    return {"shoe": shoeState(table.shoe),
+            "dealerPlays": table.dealerPlays,
+            "handsPlayed": table.handsPlayed,
+            "dealerTotal": table.dealer.total,
+            "players": [{"totalMoney": p.totalMoney,
+                         "cardCount": getattr(p, "cardCount", None),
+                         "actualCount": getattr(p, "actualCount", None)} for p in table.players]}
+
+
+def restoreTable(saved):
+    table = Table(restoreShoe(saved["shoe"]), saved["dealerPlays"])
+    table.handsPlayed = saved["handsPlayed"]
+    table.dealer.total = saved["dealerTotal"]
+    for player, p in zip(table.players, saved["players"]):
+        player.totalMoney = p["totalMoney"]
+        if p["cardCount"] is not None:
+            player.cardCount = p["cardCount"]
+            player.actualCount = p["actualCount"]
+    return table
+
+
+def save(path, state):
+    """Writes the checkpoint so that a crash in the middle leaves the last one in place"""
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(temp, path)
+
+
+class Stopped(Exception):
+    """The sweep stopped early, after saving a checkpoint"""
+
+
+def runSweep(checkpointPath, seed, decks=range(4, 9), sims=100, hands=200, dealerPlays=False,
+             penetration=None, every=30.0, resume=False, maxHands=None):
+    """Plays the grid, checkpointing every `every` seconds, and returns {(decks, sim): winnings}
+
+    With resume the run carries on from checkpointPath.  With maxHands it saves and raises
+    Stopped after playing that many hands, which is handy for jobs with a time limit."""
+    config = {"seed": seed, "decks": list(decks), "sims": sims, "hands": hands,
+              "dealerPlays": dealerPlays, "penetration": penetration}
+    state = {"version": VERSION, "config": config, "completed": {}, "current": None}
+    if resume and os.path.exists(checkpointPath):
+        with open(checkpointPath) as f:
+            saved = json.load(f)
+        if saved["version"] != VERSION or saved["config"] != config:
+            raise ValueError("checkpoint %s is for a different sweep: %s" % (checkpointPath, saved["config"]))
+        state = saved
+
+    lastSave = time.monotonic()
+    played = 0
+    for d in decks:
+        for j in range(sims):
+            key = "%d,%d" % (d, j)
+            if key in state["completed"]:
+                continue
+            current = state["current"]
+            if current is not None and current["cell"] == [d, j]:
+                table = restoreTable(current["table"])
+            else:
+                table = Table(Shoe(d, cellRng(seed, d, j), penetration=penetration), dealerPlays)
+            try:
+                while table.handsPlayed < hands:
+                    table.playHand()
+                    played += 1
+                    if maxHands is not None and played >= maxHands and table.handsPlayed < hands:
+                        raise Stopped("stopped after %d hands" % played)
+                    if time.monotonic() - lastSave >= every:
+                        state["current"] = {"cell": [d, j], "table": tableState(table)}
+                        save(checkpointPath, state)
+                        lastSave = time.monotonic()
+            except Stopped:
+                # Between hands the table is in a clean state, so it can be saved as it is
+                state["current"] = {"cell": [d, j], "table": tableState(table)}
+                save(checkpointPath, state)
+                raise
+            except KeyboardInterrupt:
+                # The hand in play is half done, but state still has the last clean copy of this
+                # cell (or none, and it starts over), along with every cell finished since
+                save(checkpointPath, state)
+                raise
+            state["completed"][key] = table.winnings()
+            state["current"] = None
+    save(checkpointPath, state)
+    return {tuple(int(x) for x in key.split(",")): rows for key, rows in state["completed"].items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the decks x simulations grid with checkpoints")
+    parser.add_argument("--checkpoint", required=True, help="checkpoint file")
+    parser.add_argument("--resume", action="store_true", help="carry on from the checkpoint file")
+    parser.add_argument("--seed", type=int, required=True, help="seed for the whole run")
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--penetration", type=float, default=None, help="deal this much of the shoe before reshuffling")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    parser.add_argument("--every", type=float, default=30.0, help="seconds between checkpoints")
+    parser.add_argument("--max-hands", type=int, default=None, help="save and stop after this many hands")
+    args = parser.parse_args()
+
+    decks = range(4, 9)
+    try:
+        results = runSweep(args.checkpoint, args.seed, decks, args.sims, args.hands, args.dealer_plays,
+                           args.penetration, args.every, args.resume, args.max_hands)
+    except Stopped as e:
+        sys.stderr.write("%s, resume with --resume\n" % e)
+        sys.exit(3)
+    for d in decks:
+        for j in range(args.sims):
+            for won, name in zip(results[(d, j)], SYSTEM_NAMES):
+                print(won, ",", d, ",", name)
@@ -0,0 +1,51 @@
+# Card counting systems
+#
+# A counting system is nothing but a tag for each card value: +1 for the small cards that
+# help the dealer, -1 or -2 for the tens and aces that help the player.  So they are all kept
+# here as a list of tags indexed by card value (2 to 11, ace is 11; 0 and 1 are never dealt).
+#
+# Counting a round then means counting how many of each value hit the table once, and
+# multiplying that by every system's tags.  Adding another system is one more row of tags.
+
+COUNTING_SYSTEMS = {}
+
+
+def registerSystem(name, tags):
+    """Adds a counting system.  tags is a dict of card value to tag, values left out count 0"""
+    row = [0]*12
+    for value, tag in tags.items():
+        row[value] = tag
+    COUNTING_SYSTEMS[name] = row
+    return row
+
+
+registerSystem("HiLo", {2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 10: -1, 11: -1})
+registerSystem("KO", {2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 10: -1, 11: -1})
+registerSystem("hiOpt", {2: 1, 3: 1, 4: 2, 5: 2, 6: 1, 7: 1, 10: -2})       # Hi-Opt II, aces are side counted
+registerSystem("Zen", {2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 1, 10: -2, 11: -1})
+
+
+def rankHistogram(*hands):
+    """How many of each card value are in the hands, indexed by card value"""
+    seen = [0]*12
+    for hand in hands:
+        for card in hand:
+            seen[card] += 1
+    return seen
+
+
+def countHistogram(tags, seen):
+    """What a round with these cards adds to the running count of one system"""
+    return sum(t*n for t, n in zip(tags, seen) if n)
+
+
+def trueCount(runningCount, shoe):
+    """The running count adjusted for how much shoe is left, 0 if the shoe is empty"""
+    # We need to vary this based on the number of decks left in the shoe.  Problem is
+    # in real life, no one can know the exact number of cards left in the shoe.
+    # Real players guess, and then they fudge a bit based on circumstances.  Since
+    # the computer can't fudge based on circumstances, we'll let it get the exact
+    # number of cards in the shoe to compensate for human intuition.
+    if shoe.pipTotal > 0:
+        return int(round(runningCount/(shoe.pipTotal/52.0)))
+    return 0
@@ -0,0 +1,161 @@
+# Comparing the counting systems on the same cards
+#
+# At the regular table the five players sit side by side, so each one gets different cards
+# and every player's winnings carry their own luck.  When the question is "does HiLo beat not
+# counting?" that luck is most of what you see.  Here each system sits alone at its own table
+# and every one of them is dealt from the same shoes (common random numbers): a shoe for each
+# system, all seeded the same, so the k-th shuffle is the same for all of them.  Everyone plays
+# the same strategy matrix, so the hands come out identical and only the bets differ.
+#
+# Alone means alone: each counter sees only its own cards and the dealer's, so these are the
+# differences for a one seat game, not for the five seat table blackjack.py plays.
+#
+# With antithetic pairing every simulation is also played a second time on mirrored shoes and
+# the two are averaged.  The mirror swaps ranks end for end, counting the four ten-valued ranks
+# apart (A-K, 2-Q, 3-J, 4-10, 5-9, 6-8, 7 stays), so the shoe has the same cards but a shoe rich
+# in small cards becomes one rich in tens and the low/high count tags mostly change sign.
+#
+# The report compares the variance of each system's difference from "none" to what
+# independent simulations would have given for the same number of hands.  A factor of 5
+# means the same precision on the difference takes a fifth of the hands.  With antithetic
+# pairing it also gives the correlation between the two passes' differences, which has to be
+# below 0 for the second pass to do better than an independent one.
+import argparse
+import math
+from array import array
+from statistics import NormalDist
+
+import numpy as np
+
+from blackjack import (SYSTEM_NAMES, Dealer, HiLoPlayer, HiOptPlayer, KOPlayer, Player, Shoe, ZenPlayer,
+                       countRound, payout)
+from parallel import cellRng
+
+# One of each, in the order of SYSTEM_NAMES
+PLAYER_CLASSES = [Player, HiLoPlayer, KOPlayer, HiOptPlayer, ZenPlayer]
+
+
+# What each card value becomes in the mirror, ten-valued cards aside (they go by TEN_MIRROR)
+MIRROR = np.array([0, 0, 10, 10, 10, 9, 8, 7, 6, 5, 0, 10], dtype=np.int8)
+# A ten-valued card is one of 10, J, Q and K, which mirror to 4, 3, 2 and A
+TEN_MIRROR = np.array([4, 3, 2, 11], dtype=np.int8)
+
+
+class MirroredShoe(Shoe):
+    """A Shoe whose every shuffle comes out mirrored (see MIRROR), for the antithetic pass
+
+    Given the same generator as a Shoe it shuffles the same way and deals the mirror image of
+    its cards.  Which ten-valued card is which rank comes from labelRng, so the mirrored shoe is
+    as random as the plain one.  Like a Shoe, the first shoe isn't shuffled, so it isn't mirrored."""
+
+    def __init__(self, num=6, rng=None, paranoid=None, penetration=None, labelRng=None):
+        Shoe.__init__(self, num, rng, paranoid, penetration)
+        self.labelRng = labelRng if labelRng is not None else np.random.default_rng()
+        self.labels = np.repeat(np.arange(4), 4*num)
+        self.plain = np.empty(len(self.cards), dtype=np.int8)
+        self.mirrored = False
+
+    def shuffle(self):
+        # Put the plain cards back first, since a shuffle starts from whatever order the
+        # last one left them in, and the plain Shoe's shuffles have to be followed exactly
+        if self.mirrored:
+            self.cards[:] = array("b", self.plain.tobytes())
+        Shoe.shuffle(self)
+        cards = np.frombuffer(self.cards, dtype=np.int8)
+        self.plain[:] = cards
+        tens = cards == 10
+        self.labelRng.shuffle(self.labels)
+        mirrored = MIRROR[cards]
+        mirrored[tens] = TEN_MIRROR[self.labels]
+        cards[:] = mirrored
+        self.mirrored = True
+
+
+def playAlone(player, shoe, hands=200, dealerPlays=False):
+    """Plays hands with the player alone at the table and returns how much they won"""
+    dealer = Dealer()
+    counters = [player] if hasattr(player, "tags") else []
+    for k in range(hands):
+        shoe.newRound()
+        player.dealToSelf(shoe)
+        dealer.dealToSelf(shoe)
+        player.play(shoe, dealer.showCard)
+        if dealerPlays:
+            dealer.play(shoe)
+        player.totalMoney = player.totalMoney + player.bet*payout(player, dealer)
+        countRound(counters, shoe, player.cards, dealer.cards)
+    return player.totalMoney - 10000
+
+
+def runCommon(decks, sim, seed=0, hands=200, dealerPlays=False, penetration=None, antithetic=False):
+    """Plays every system on the same shoes, returns a row of winnings per pass (two with antithetic)"""
+    rows = [[playAlone(makePlayer(), Shoe(decks, cellRng(seed, decks, sim), penetration=penetration),
+                       hands, dealerPlays)
+             for makePlayer in PLAYER_CLASSES]]
+    if antithetic:
+        # The labels get their own stream, so the shuffles stay in step with the plain pass
+        labels = np.random.SeedSequence(seed, spawn_key=(decks, sim, 1))
+        rows.append([playAlone(makePlayer(), MirroredShoe(decks, cellRng(seed, decks, sim), penetration=penetration,
+                                                          labelRng=np.random.default_rng(labels)),
+                               hands, dealerPlays)
+                     for makePlayer in PLAYER_CLASSES])
+    return rows
+
+
+def runComparison(decks=range(4, 9), sims=100, seed=0, hands=200, dealerPlays=False, penetration=None,
+                  antithetic=False):
+    """Returns {decks: array of winnings shaped (sims, passes, systems)}"""
+    return {d: np.array([runCommon(d, j, seed, hands, dealerPlays, penetration, antithetic) for j in range(sims)],
+                        dtype=np.float64)
+            for d in decks}
+
+
+def varianceReport(runs, confidence=0.95):
+    """Works out what the pairing bought, from one deck count's (sims, passes, systems) winnings
+
+    Returns a list of dicts, one per counting system, about its difference from "none"."""
+    sims, passes, systems = runs.shape
+    z = NormalDist().inv_cdf(0.5 + confidence/2)
+    report = []
+    for k in range(1, systems):
+        # one value per simulation, averaging the antithetic passes
+        passDifferences = runs[:, :, k] - runs[:, :, 0]
+        difference = passDifferences.mean(axis=1)
+        correlation = math.nan
+        if passes == 2 and passDifferences.std(axis=0).min() > 0:
+            correlation = np.corrcoef(passDifferences[:, 0], passDifferences[:, 1])[0, 1]
+        achieved = difference.var(ddof=1)
+        # Independent simulations would have their own variances add up, and would
+        # average the same number of passes
+        flat = runs.reshape(sims*passes, systems)
+        independent = (flat[:, k].var(ddof=1) + flat[:, 0].var(ddof=1))/passes
+        report.append({"system": SYSTEM_NAMES[k],
+                       "difference": difference.mean(),
+                       "halfWidth": z*math.sqrt(achieved/sims),
+                       "independentHalfWidth": z*math.sqrt(independent/sims),
+                       "reduction": independent/achieved if achieved > 0 else math.inf,
+                       "pairCorrelation": correlation})
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare each counting system to not counting on the same cards")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--penetration", type=float, default=None, help="deal this much of the shoe before reshuffling")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    parser.add_argument("--antithetic", action="store_true", help="also play every simulation on mirrored shoes")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    args = parser.parse_args()
+
+    results = runComparison(range(4, 9), args.sims, args.seed, args.hands, args.dealer_plays, args.penetration,
+                            args.antithetic)
+    print("# each system plays alone with the dealer, a one seat game rather than blackjack.py's five seat table")
+    print("decks , system , difference from none , halfwidth , independent halfwidth , variance reduction , "
+          "pair correlation")
+    for d, runs in results.items():
+        for r in varianceReport(runs, args.confidence):
+            print(d, ",", r["system"], ",", round(r["difference"], 2), ",", round(r["halfWidth"], 2), ",",
+                  round(r["independentHalfWidth"], 2), ",", round(r["reduction"], 1), ",",
+                  round(r["pairCorrelation"], 3))
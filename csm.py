@@ -0,0 +1,84 @@
+# A shoe fed by a continuous shuffling machine
+#
+# Casinos with a CSM put the cards from every round straight back into the machine, so the
+# shoe never runs down and there's never a reshuffle for a counter to reset on.  CSMShoe does
+# the same: when the next round starts, each card from the last one goes back into a random
+# place among the cards still in the shoe.
+#
+# The cards dealt in a round are still sitting in the array just past cardsLeft (dealing only
+# moves cardsLeft down), so putting one back is one step of an "inside out" Fisher-Yates
+# shuffle: grow the shoe by that one position and swap the card with a random position in it.
+# If the shoe was in random order before, it still is, and each card costs one swap however
+# many decks there are.
+#
+# Once the cards are back, nothing a counter has seen is missing from the shoe any more, so
+# the count at the time of a bet is always 0.  CSMShoe is continuous, and a counter betting at
+# a continuous shoe starts from 0 (CountingPlayer.placeBet, SeatTable.placeBet) instead of
+# carrying the count on and drifting further every round.  The counters' rows come out as
+# flat bettors', which is what a CSM is for.
+#
+# python csm.py --seed 1           the usual rows, dealt from a CSM
+import argparse
+import random
+
+from blackjack import SYSTEM_NAMES, Shoe, runSimulation
+from parallel import cellRng
+
+
+class CSMShoe(Shoe):
+    """A Shoe that puts each round's cards back in random places before the next round"""
+
+    continuous = True
+
+    def __init__(self, num=6, rng=None, paranoid=None):
+        # A machine is loaded shuffled, unlike a Shoe's first shoe.  The cut card means
+        # nothing here, so there's no penetration.
+        Shoe.__init__(self, num, rng, paranoid)
+        self.shuffler = rng if rng is not None else random.SystemRandom()
+        self.shuffle()
+
+    def fill(self):
+        Shoe.fill(self)
+        self.roundStart = self.cardsLeft  # cardsLeft when the round started
+
+    def uniforms(self, n):
+        """n random numbers in [0, 1), in one call for a numpy generator"""
+        if hasattr(self.shuffler, "bit_generator"):
+            return self.shuffler.random(n).tolist()
+        return [self.shuffler.random() for i in range(n)]
+
+    def newRound(self):
+        """Puts the last round's cards back into the shoe, each one at a random place"""
+        returned = self.roundStart - self.cardsLeft
+        if returned:
+            cards, rankCounts = self.cards, self.rankCounts
+            left = self.cardsLeft
+            for u in self.uniforms(returned):
+                # cards[left] is the next card to go back.  Counting it in, it swaps with
+                # any of the left+1 places, itself included, with the same chance.
+                j = min(int(u*(left+1)), left)  # u*(left+1) can round up to left+1
+                card = cards[left]
+                cards[left] = cards[j]
+                cards[j] = card
+                rankCounts[card] += 1
+                self.pipTotal += card
+                left += 1
+            self.cardsLeft = left
+            if self.profiler is not None:
+                self.profiler.count("cards returned", returned)
+        self.roundStart = self.cardsLeft
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the decks x simulations grid against a continuous shuffler")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    args = parser.parse_args()
+
+    for d in range(4, 9):
+        for j in range(args.sims):
+            shoe = CSMShoe(d, cellRng(args.seed, d, j))
+            for won, name in zip(runSimulation(shoe, args.hands, args.dealer_plays), SYSTEM_NAMES):
+                print(won, ",", d, ",", name)
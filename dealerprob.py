@@ -0,0 +1,171 @@
+# Exact odds for a hand, worked out instead of simulated
+#
+# Given the dealer's up card and exactly which cards haven't been seen yet, the chance of
+# every way the dealer can finish is a short recursion: draw each card value in proportion
+# to how many are left and follow the dealer's rule (hit below 17, stand on all 17s, same as
+# Dealer.play).  The player's stand, hit and double values come from the same recursion.
+#
+# The answers are paid the way payout() pays them, in units of the bet:
+#   a natural wins 2 (payout gives back 3 times the bet), or 1 against a dealer natural
+#   a dealer natural beats everything else
+#   a bust player loses even if the dealer busts too
+#   otherwise the player wins unless the dealer has more, ties go to the player
+#
+# Compositions are lists of the count of each card value indexed by value, like
+# Shoe.rankCounts, and should hold every card the player hasn't seen, which includes the
+# dealer's hole card.
+from functools import lru_cache
+
+from handstate import BUST, EMPTY, NEXT, TOTAL, handState
+
+# Where each dealer outcome is kept in the vectors returned by dealerOutcomes
+OUTCOMES = [17, 18, 19, 20, 21, "bust", "blackjack"]
+BUST_INDEX, BLACKJACK_INDEX = 5, 6
+
+
+class ExactEngine:
+    """Exact dealer outcome probabilities and player EVs for any shoe composition"""
+
+    def __init__(self, cacheSize=1 << 18):
+        """cacheSize caps how many (hand, composition) results are remembered by each recursion"""
+        # The caches are made per engine so that cacheSize is per engine too
+        self._dealer = lru_cache(maxsize=cacheSize)(self._dealerFrom)
+        self._hit = lru_cache(maxsize=cacheSize)(self._hitFrom)
+
+    def cacheInfo(self):
+        """Hits, misses and sizes of the two caches"""
+        return {"dealer": self._dealer.cache_info(), "hit": self._hit.cache_info()}
+
+    def clearCache(self):
+        self._dealer.cache_clear()
+        self._hit.cache_clear()
+
+    # DEALER
+    def _dealerFrom(self, state, counts):
+        t = TOTAL[state]
+        if t == -1:
+            return (0.0,)*BLACKJACK_INDEX + (1.0,)
+        if t > 21:
+            return (0.0,)*BUST_INDEX + (1.0, 0.0)
+        if t >= 17:
+            final = [0.0]*len(OUTCOMES)
+            final[t-17] = 1.0
+            return tuple(final)
+        left = sum(counts)
+        if left == 0:
+            raise ValueError("ran out of cards before the dealer finished")
+        final = [0.0]*len(OUTCOMES)
+        for card in range(2, 12):
+            if counts[card]:
+                p = counts[card]/left
+                after = counts[:card] + (counts[card]-1,) + counts[card+1:]
+                for k, q in enumerate(self._dealer(NEXT[state][card], after)):
+                    final[k] += p*q
+        return tuple(final)
+
+    def dealerOutcomes(self, upCard, counts):
+        """Probability of each of OUTCOMES for the dealer, with the hole card still to come out of counts"""
+        return self._dealer(NEXT[EMPTY][upCard], tuple(counts))
+
+    # PLAYER
+    @staticmethod
+    def standAgainst(playerTotal, dealer):
+        """EV of standing on a total (-1 for a blackjack) against a dealerOutcomes vector"""
+        if playerTotal == -1:
+            return dealer[BLACKJACK_INDEX]*1 + (1-dealer[BLACKJACK_INDEX])*2
+        if playerTotal > 21:
+            return -1.0
+        ev = dealer[BUST_INDEX] - dealer[BLACKJACK_INDEX]
+        for k in range(5):
+            ev += dealer[k] if playerTotal >= 17+k else -dealer[k]
+        return ev
+
+    def _standState(self, state, upCard, counts):
+        if BUST[state]:
+            return -1.0
+        return self.standAgainst(TOTAL[state], self._dealer(NEXT[EMPTY][upCard], counts))
+
+    def _hitFrom(self, state, upCard, counts):
+        # Take a card, then do whichever is better from there, standing or hitting again
+        left = sum(counts)
+        ev = 0.0
+        for card in range(2, 12):
+            if counts[card]:
+                p = counts[card]/left
+                after = counts[:card] + (counts[card]-1,) + counts[card+1:]
+                nextState = NEXT[state][card]
+                if BUST[nextState]:
+                    ev -= p
+                else:
+                    ev += p*max(self._standState(nextState, upCard, after), self._hit(nextState, upCard, after))
+        return ev
+
+    def standEV(self, playerCards, upCard, counts):
+        """EV of standing on these cards"""
+        return self._standState(handState(playerCards), upCard, tuple(counts))
+
+    def hitEV(self, playerCards, upCard, counts):
+        """EV of taking a card and then playing on perfectly (hit or stand, no more doubling)"""
+        return self._hit(handState(playerCards), upCard, tuple(counts))
+
+    def doubleEV(self, playerCards, upCard, counts, staleTotal=False, firstBetOnly=False):
+        """EV of doubling: twice the bet, exactly one more card
+
+        The simulators (Player.play, BatchTable) pay a double differently from a casino in two
+        ways.  They resolve it on the total from before the extra card, which staleTotal=True
+        follows.  And only the first bet comes out of the bankroll, so a doubled hand nets 3 first
+        bets when it wins and loses 1, which firstBetOnly=True follows.  With both, the answer is
+        in the simulators' units and can be checked against their doubled hands."""
+        state = handState(playerCards)
+        counts = tuple(counts)
+        left = sum(counts)
+        ev = 0.0
+        for card in range(2, 12):
+            if counts[card]:
+                p = counts[card]/left
+                after = counts[:card] + (counts[card]-1,) + counts[card+1:]
+                if staleTotal:
+                    dealer = self._dealer(NEXT[EMPTY][upCard], after)
+                    ev += p*self.standAgainst(TOTAL[state], dealer)
+                else:
+                    ev += p*self._standState(NEXT[state][card], upCard, after)
+        if firstBetOnly:
+            return 2*ev + 1  # paid 2*payout, less the one bet taken up front
+        return 2*ev
+
+    def evaluate(self, playerCards, upCard, counts):
+        """Stand, hit and double EVs for a hand in one dict"""
+        return {"stand": self.standEV(playerCards, upCard, counts),
+                "hit": self.hitEV(playerCards, upCard, counts),
+                "double": self.doubleEV(playerCards, upCard, counts)}
+
+
+def fullShoe(numDecks):
+    """Composition of a full shoe, indexed by card value"""
+    return [0, 0] + [4*numDecks]*8 + [16*numDecks, 4*numDecks]
+
+
+def unseen(numDecks, *hands):
+    """Composition of a full shoe minus every card in the hands"""
+    counts = fullShoe(numDecks)
+    for hand in hands:
+        for card in hand:
+            counts[card] -= 1
+    return counts
+
+
+if __name__ == "__main__":
+    import time
+
+    engine = ExactEngine()
+    start = time.perf_counter()
+    print("dealer outcomes, full 6 deck shoe")
+    print("up  " + "".join("%10s" % o for o in OUTCOMES))
+    for up in range(2, 12):
+        outcomes = engine.dealerOutcomes(up, unseen(6, [up]))
+        print("%-4s" % ("A" if up == 11 else up) + "".join("%10.4f" % p for p in outcomes))
+    print("%.1f ms" % ((time.perf_counter()-start)*1000))
+
+    start = time.perf_counter()
+    print("\n10,6 against a 10:", engine.evaluate([10, 6], 10, unseen(6, [10, 6, 10])))
+    print("%.1f ms" % ((time.perf_counter()-start)*1000))
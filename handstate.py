@@ -0,0 +1,95 @@
+# Hands as small integers
+#
+# Everything the game needs to know about a hand fits in a few numbers: its total (with an
+# ace counted as 11 only if that doesn't bust it), whether such a soft ace is still in it,
+# and how many cards it has (0, 1, 2 or 3-and-up, since only two-card hands are special:
+# they can be a blackjack and they can double down).  Blackjack itself is just two cards
+# adding to 21.
+#
+# So a hand is a state number, and every question about it is a table lookup:
+#   NEXT[state][card]      the hand after taking another card
+#   TOTAL[state]           what total() would say, -1 for a blackjack
+#   BUST[state]            whether it's over 21
+#   TWO_CARDS[state]       whether it's exactly two cards, the only hands that can double
+# and a strategy matrix like Player.betPlayMatrix is compiled into
+#   strategy[state][dealer card]   HIT, STAND or DOUBLE
+from functools import lru_cache
+
+HIT, STAND, DOUBLE = 0, 1, 2
+ACTION_CODES = {"H": HIT, "S": STAND, "D": DOUBLE}
+
+MAX_TOTAL = 31           # the most a hand that wasn't already bust can get to, hard 21 plus a 10
+NUM_STATES = 4*2*(MAX_TOTAL+1)
+
+
+def makeState(total, soft, numCards):
+    """The state number of a hand with this total, soft ace flag and number of cards"""
+    return (min(numCards, 3)*2 + soft)*(MAX_TOTAL+1) + total
+
+
+def unpackState(state):
+    """(total, soft ace flag, number of cards with 3 meaning 3 or more) for a state"""
+    total = state % (MAX_TOTAL+1)
+    rest = state // (MAX_TOTAL+1)
+    return total, rest % 2, rest // 2
+
+
+def _buildTables():
+    nextState, totals, busts = [], [], []
+    for state in range(NUM_STATES):
+        total, soft, numCards = unpackState(state)
+        row = [state]*12  # values 0 and 1 are never dealt
+        for card in range(2, 12):
+            t = total + card
+            s = soft + (card == 11)
+            while t > 21 and s > 0:
+                t -= 10     # Because 1 is 10 less than 11
+                s -= 1
+            row[card] = makeState(min(t, MAX_TOTAL), min(s, 1), numCards+1)
+        nextState.append(tuple(row))
+        totals.append(-1 if numCards == 2 and total == 21 else total)
+        busts.append(total > 21)
+    return tuple(nextState), tuple(totals), tuple(busts)
+
+
+NEXT, TOTAL, BUST = _buildTables()
+TWO_CARDS = tuple(unpackState(state)[2] == 2 for state in range(NUM_STATES))
+EMPTY = makeState(0, 0, 0)
+
+
+def handState(cards):
+    """The state of a hand of cards"""
+    state = EMPTY
+    for card in cards:
+        state = NEXT[state][card]
+    return state
+
+
+def compileStrategy(matrix):
+    """Turns a 9x10 H/S/D matrix for hard 8 to 16 (like Player.betPlayMatrix) into strategy[state][dealer card]"""
+    return _compile(tuple(tuple(row) for row in matrix))
+
+
+@lru_cache(maxsize=None)
+def _compile(matrix):
+    # The same rules Player.play always used: stand on a blackjack or anything over 16,
+    # hit anything under 8, ask the matrix in between.  You can only double on two cards,
+    # after that a double means stand.
+    table = []
+    for state in range(NUM_STATES):
+        total, soft, numCards = unpackState(state)
+        t = TOTAL[state]
+        row = [STAND]*12
+        for dealerCard in range(2, 12):
+            if t == -1 or t > 16:
+                whatToDo = STAND
+            elif t < 8:
+                whatToDo = HIT
+            else:
+                x = 1 if dealerCard == 11 else dealerCard
+                whatToDo = ACTION_CODES[matrix[t-8][x-1]]
+                if whatToDo == DOUBLE and numCards != 2:
+                    whatToDo = STAND
+            row[dealerCard] = whatToDo
+        table.append(tuple(row))
+    return tuple(table)
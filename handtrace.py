@@ -0,0 +1,186 @@
+# Traces of a sweep that can play any stretch of any simulation again
+#
+# blackjack.py shuffles with SystemRandom, so a suspicious row (a huge win for Zen at 7 decks,
+# say) can never be dealt again.  record() plays the same grid with the same Table, Dealer,
+# players and payout, but every cell's shoe is seeded from (seed, decks, simulation) like
+# parallel.py and checkpoint.py (the numbers are checkpoint.py's), and it writes a trace:
+#
+#   header.json     the seed and settings, which is all it takes to play any cell from scratch
+#   snapshots.jsonl every `every` hands of every cell, the whole table (checkpoint.tableState),
+#                   plus the hands since the last snapshot that reshuffled the shoe
+#   index.bin       where each snapshot starts in snapshots.jsonl, 8 bytes each in grid order
+#
+# Every cell has the same number of snapshots, so the index entry for (decks, sim, hand) is
+# found by arithmetic.  Replaying hand k of simulation j reads one index entry and one
+# snapshot line and plays at most every-1 hands to get there, however long the sweep was.
+# Recording writes as it goes and keeps nothing but the table being played.  checkTrace plays
+# a whole trace again from its seed and compares it snapshot by snapshot.
+#
+# python handtrace.py record --seed 7 --out trace7                       the usual rows, and a trace
+# python handtrace.py replay trace7 --decks 7 --sim 42 --hands 120 130   every card of hands 120 to 129
+import argparse
+import bisect
+import json
+import os
+import struct
+import sys
+
+from blackjack import SYSTEM_NAMES, Shoe, Table
+from checkpoint import restoreTable, tableState
+from parallel import cellRng
+
+VERSION = 1
+
+
+def snapshotHands(hands, every):
+    """The hands before which a cell is snapshotted, ending with the finished cell"""
+    return list(range(0, hands, every)) + [hands]
+
+
+def record(path, seed, decks=range(4, 9), sims=100, hands=200, dealerPlays=False, penetration=None, every=50):
+    """Plays the grid writing a trace to directory path, and yields (decks, sim, winnings) as cells finish"""
+    os.makedirs(path, exist_ok=True)
+    header = {"version": VERSION, "seed": seed, "decks": list(decks), "sims": sims, "hands": hands,
+              "dealerPlays": dealerPlays, "penetration": penetration, "every": every}
+    with open(os.path.join(path, "snapshots.jsonl"), "wb") as snapshots, \
+            open(os.path.join(path, "index.bin"), "wb") as index:
+        for d in decks:
+            for j in range(sims):
+                table = Table(Shoe(d, cellRng(seed, d, j), penetration=penetration), dealerPlays)
+                shuffles = []
+                for stop in snapshotHands(hands, every):
+                    while table.handsPlayed < stop:
+                        cardsLeft = table.shoe.cardsLeft
+                        table.playHand()
+                        # Dealing only takes cards away, so more cards than before means a reshuffle
+                        if table.shoe.cardsLeft > cardsLeft:
+                            shuffles.append(table.handsPlayed - 1)
+                    index.write(struct.pack("<Q", snapshots.tell()))
+                    line = {"cell": [d, j], "hand": stop, "shuffles": shuffles, "table": tableState(table)}
+                    snapshots.write(json.dumps(line, separators=(",", ":")).encode() + b"\n")
+                    shuffles = []
+                yield d, j, table.winnings()
+    # Written last, so a trace cut short by a crash doesn't look like a whole one
+    with open(os.path.join(path, "header.json"), "w") as f:
+        json.dump(header, f)
+
+
+class Trace:
+    """A recorded trace, for seeking to any hand of any cell"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "header.json")) as f:
+            self.header = json.load(f)
+        if self.header["version"] != VERSION:
+            raise ValueError("trace %s is version %s, this reads %d" % (path, self.header["version"], VERSION))
+        self.stops = snapshotHands(self.header["hands"], self.header["every"])
+
+    def snapshot(self, decks, sim, hand=0):
+        """The last snapshot of a cell at or before hand"""
+        h = self.header
+        if decks not in h["decks"] or not 0 <= sim < h["sims"] or not 0 <= hand <= h["hands"]:
+            raise ValueError("no hand %d of simulation %d with %d decks in this trace" % (hand, sim, decks))
+        # the last stretch can be shorter than every, so it's looked up rather than divided out
+        k = bisect.bisect_right(self.stops, hand) - 1
+        entry = (h["decks"].index(decks)*h["sims"] + sim)*len(self.stops) + k
+        with open(os.path.join(self.path, "index.bin"), "rb") as index:
+            index.seek(8*entry)
+            offset, = struct.unpack("<Q", index.read(8))
+        with open(os.path.join(self.path, "snapshots.jsonl"), "rb") as snapshots:
+            snapshots.seek(offset)
+            return json.loads(snapshots.readline())
+
+    def table(self, decks, sim, hand=0):
+        """The cell's Table as it was just before hand was dealt"""
+        table = restoreTable(self.snapshot(decks, sim, hand)["table"])
+        while table.handsPlayed < hand:
+            table.playHand()
+        return table
+
+    def winnings(self, decks, sim):
+        """The cell's row, read from its last snapshot"""
+        return [p["totalMoney"] - 10000 for p in self.snapshot(decks, sim, self.header["hands"])["table"]["players"]]
+
+    def shuffles(self, decks, sim):
+        """The hands of a cell during which the shoe was reshuffled"""
+        return [hand for stop in self.stops for hand in self.snapshot(decks, sim, stop)["shuffles"]]
+
+    def replay(self, decks, sim, first, last=None):
+        """Plays hands first up to last again, yielding what happened in each one"""
+        last = first+1 if last is None else min(last, self.header["hands"])
+        table = self.table(decks, sim, first)
+        while table.handsPlayed < last:
+            before = [p.totalMoney for p in table.players]
+            cardsLeft = table.shoe.cardsLeft
+            table.playHand()
+            yield {"hand": table.handsPlayed - 1,
+                   "shuffled": table.shoe.cardsLeft > cardsLeft,
+                   "dealer": list(table.dealer.cards),
+                   "dealerTotal": table.dealer.total,
+                   "players": [{"system": name, "cards": list(p.cards), "total": p.total, "bet": p.bet,
+                                "doubled": p.doubled, "won": p.totalMoney - money,
+                                "count": getattr(p, "cardCount", None)}
+                               for name, p, money in zip(SYSTEM_NAMES, table.players, before)]}
+
+
+def checkTrace(path):
+    """Plays every cell of a trace again from its seed and makes sure snapshots, winnings and shuffles agree"""
+    trace = Trace(path)
+    h = trace.header
+    for d in h["decks"]:
+        for j in range(h["sims"]):
+            table = Table(Shoe(d, cellRng(h["seed"], d, j), penetration=h["penetration"]), h["dealerPlays"])
+            shuffles = []
+            for hand in range(h["hands"]+1):
+                if tableState(trace.table(d, j, hand)) != tableState(table):
+                    raise AssertionError("simulation %d with %d decks differs before hand %d" % (j, d, hand))
+                if hand < h["hands"]:
+                    cardsLeft = table.shoe.cardsLeft
+                    table.playHand()
+                    if table.shoe.cardsLeft > cardsLeft:
+                        shuffles.append(hand)
+            if trace.winnings(d, j) != table.winnings() or trace.shuffles(d, j) != shuffles:
+                raise AssertionError("simulation %d with %d decks: trace %s %s, played %s %s" % (
+                    j, d, trace.winnings(d, j), trace.shuffles(d, j), table.winnings(), shuffles))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record a sweep with a trace, or replay any hands of it")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recordCommand = commands.add_parser("record", help="play the grid, printing the rows and writing a trace")
+    recordCommand.add_argument("--out", required=True, help="trace directory")
+    recordCommand.add_argument("--seed", type=int, required=True, help="seed for the whole run")
+    recordCommand.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    recordCommand.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    recordCommand.add_argument("--penetration", type=float, default=None, help="deal this much of the shoe before reshuffling")
+    recordCommand.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    recordCommand.add_argument("--every", type=int, default=50, help="hands between snapshots")
+    replayCommand = commands.add_parser("replay", help="play some hands of one simulation again, card by card")
+    replayCommand.add_argument("trace", help="trace directory")
+    replayCommand.add_argument("--decks", type=int, required=True)
+    replayCommand.add_argument("--sim", type=int, required=True)
+    replayCommand.add_argument("--hands", type=int, nargs=2, metavar=("FIRST", "LAST"), default=None,
+                               help="hands FIRST up to LAST (default: the whole simulation)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        for d, j, winnings in record(args.out, args.seed, range(4, 9), args.sims, args.hands, args.dealer_plays,
+                                     args.penetration, args.every):
+            for won, name in zip(winnings, SYSTEM_NAMES):
+                print(won, ",", d, ",", name)
+    else:
+        trace = Trace(args.trace)
+        first, last = args.hands or (0, trace.header["hands"])
+        try:
+            hands = list(trace.replay(args.decks, args.sim, first, last))
+        except ValueError as e:
+            sys.exit(str(e))
+        print("hand , system , cards , total , bet , doubled , won , count , dealer cards , dealer total")
+        for h in hands:
+            if h["shuffled"]:
+                print("# shoe reshuffled during hand %d" % h["hand"])
+            for p in h["players"]:
+                print(h["hand"], ",", p["system"], ",", " ".join(map(str, p["cards"])), ",", p["total"], ",", p["bet"],
+                      ",", int(p["doubled"]), ",", p["won"], ",", p["count"], ",", " ".join(map(str, h["dealer"])),
+                      ",", h["dealerTotal"])
@@ -0,0 +1,74 @@
+# Where does the time go?
+#
+# A Profiler handed to runSimulation times each phase of every round (DEAL, PLAY, RESOLVE
+# HAND, COUNT CARDS) and counts what happened: cards dealt, doubles, busts, dealer hits, and
+# the shoe's shuffles and refills.  Without one, runSimulation only pays for an "is None"
+# check at each phase, and the shoe only checks when it reshuffles.
+import sys
+import time
+from collections import Counter, defaultdict
+
+
+class Profiler:
+    """Collects time per phase and counts of events over a run"""
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.phase = None
+        self.started = 0.0
+
+    def start(self, phase):
+        """Ends the phase we're in, if any, and starts timing this one"""
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.times[self.phase] += now - self.started
+            self.calls[self.phase] += 1
+        self.phase = phase
+        self.started = now
+
+    def stop(self):
+        """Ends the phase we're in"""
+        self.start(None)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def timeEvent(self, name, f, *args):
+        """Calls f(*args) and adds its time to the event name, without touching the current phase"""
+        start = time.perf_counter()
+        result = f(*args)
+        self.times[name] += time.perf_counter() - start
+        self.calls[name] += 1
+        return result
+
+    def merge(self, other):
+        """Adds another profiler's numbers to this one, for runs split over several profilers"""
+        for name, t in other.times.items():
+            self.times[name] += t
+        self.calls.update(other.calls)
+        self.counters.update(other.counters)
+
+    def summary(self):
+        """A printable table of the phases and counters"""
+        phaseTotal = sum(t for name, t in self.times.items() if name in PHASES) or 1.0
+        lines = ["%-18s %10s %7s %10s %10s" % ("phase", "seconds", "%", "calls", "us/call")]
+        for name in PHASES + sorted(set(self.times) - set(PHASES)):
+            if name not in self.times:
+                continue
+            t, n = self.times[name], self.calls[name]
+            share = "%6.1f%%" % (100*t/phaseTotal) if name in PHASES else "%7s" % "-"
+            lines.append("%-18s %10.3f %s %10d %10.2f" % (name, t, share, n, 1e6*t/max(n, 1)))
+        lines.append("")
+        for name in sorted(self.counters):
+            lines.append("%-18s %10d" % (name, self.counters[name]))
+        return "\n".join(lines)
+
+    def dump(self, out=sys.stderr):
+        out.write(self.summary() + "\n")
+
+
+# The phases of a round, in order.  Shuffles are timed as an event on their own and
+# their time is also inside whichever phase they happened in.
+PHASES = ["DEAL", "PLAY", "RESOLVE HAND", "COUNT CARDS"]
@@ -0,0 +1,163 @@
+# Runs the decks x simulations grid from blackjack.py across several processes
+#
+# Every (decks, simulation) cell is its own table with its own random stream, seeded from
+# the run's seed plus the cell's coordinates.  A cell doesn't care which worker plays it or
+# which other cells share its batch, so the output is the same for any number of workers,
+# and any one cell can be played again by itself with runCell.
+import argparse
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from batch import BatchTable
+from blackjack import SYSTEM_NAMES
+from results import HAND_COLUMNS, SIMULATION_COLUMNS, ColumnBuffer, HandRecorder, SharedGrid, openWriter
+
+
+def cellRng(seed, decks, sim):
+    """The random generator for one cell of the grid"""
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(decks, sim)))
+
+
+def runCells(cells, seed, hands=200, dealerPlays=False, recordHands=False, penetration=None, betRamp=None):
+    """Plays a list of (decks, sim) cells as one batch and returns a row of winnings for each
+
+    With recordHands it returns (rows, per-hand columns) instead, see results.HAND_COLUMNS"""
+    decks = [d for d, sim in cells]
+    rngs = [cellRng(seed, d, sim) for d, sim in cells]
+    table = BatchTable(decks, rngs, dealerPlays, penetration=penetration, betRamp=betRamp)
+    if not recordHands:
+        return table.run(hands).tolist()
+    handRows = ColumnBuffer(HAND_COLUMNS)
+    rows = table.run(hands, HandRecorder(handRows, [sim for d, sim in cells]).record)
+    return rows.tolist(), handRows.data()
+
+
+def runCell(decks, sim, seed, hands=200, dealerPlays=False):
+    """Plays a single cell on its own, same answer as it gets inside a full run"""
+    return runCells([(decks, sim)], seed, hands, dealerPlays)[0]
+
+
+def _runChunk(args):
+    cells, seed, hands, dealerPlays, recordHands = args
+    result = runCells(cells, seed, hands, dealerPlays, recordHands)
+    if not recordHands:
+        return cells, result, None
+    return cells, result[0], result[1]
+
+
+def runGrid(decks=range(4, 9), sims=100, seed=0, hands=200, workers=None, chunkSize=50, dealerPlays=False,
+            handWriter=None):
+    """Yields (decks, sim, winnings) for every cell of the grid, in grid order
+
+    If handWriter is given (see results.openWriter) every hand of every cell is written to it."""
+    cells = [(d, j) for d in decks for j in range(sims)]
+    # Each chunk is played as one batch, which is both what keeps numpy busy and what keeps
+    # the traffic between processes down to one message per chunk each way
+    recordHands = handWriter is not None
+    chunks = [(cells[k:k+chunkSize], seed, hands, dealerPlays, recordHands)
+              for k in range(0, len(cells), chunkSize)]
+    pool = None if workers == 1 else multiprocessing.Pool(workers)
+    try:
+        results = map(_runChunk, chunks) if pool is None else pool.imap(_runChunk, chunks)
+        for chunk, rows, handRows in results:
+            if handRows is not None:
+                handWriter.append(**handRows)
+            for (d, j), row in zip(chunk, rows):
+                yield d, j, row
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+# The SharedGrid a worker process writes into, attached once when the worker starts
+_grid = None
+
+
+def _attachGrid(name, decks, sims):
+    global _grid
+    _grid = SharedGrid(decks, sims, name)
+
+
+def _fillChunk(args):
+    cells, seed, hands, dealerPlays = args
+    for (d, j), row in zip(cells, runCells(cells, seed, hands, dealerPlays)):
+        _grid.put(d, j, row)
+    return len(cells)
+
+
+def runGridShared(grid, seed=0, hands=200, workers=None, chunkSize=50, dealerPlays=False):
+    """Plays every cell of a results.SharedGrid, with the workers writing winnings straight into it
+
+    Only the chunk's cells go to a worker and only a count comes back, so nothing the size of
+    the results is pickled.  grid.summary() is good to read at any time, even while this runs."""
+    global _grid
+    cells = [(d, j) for d in grid.decks for j in range(grid.sims)]
+    chunks = [(cells[k:k+chunkSize], seed, hands, dealerPlays) for k in range(0, len(cells), chunkSize)]
+    if workers == 1:
+        _grid = grid
+        try:
+            for chunk in chunks:
+                _fillChunk(chunk)
+        finally:
+            _grid = None
+        return
+    pool = multiprocessing.Pool(workers, initializer=_attachGrid, initargs=(grid.name, grid.decks, grid.sims))
+    try:
+        for done in pool.imap_unordered(_fillChunk, chunks):
+            pass
+    finally:
+        pool.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the decks x simulations grid on several processes")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the whole run (default: random)")
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--chunk", type=int, default=50, help="cells handed to a worker at a time")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    parser.add_argument("--out", help="write results to this directory instead of printing them")
+    parser.add_argument("--format", choices=["columnar", "csv"], default="columnar", help="format for --out")
+    parser.add_argument("--record-hands", action="store_true", help="with --out, also write every hand")
+    parser.add_argument("--summary", action="store_true",
+                        help="print the mean, std, min and max for each decks and system instead of every row")
+    args = parser.parse_args()
+
+    seed = args.seed
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    # Without the seed a suspicious row can't be played again
+    sys.stderr.write("seed %d\n" % seed)
+
+    if args.summary:
+        with SharedGrid(range(4, 9), args.sims) as grid:
+            runGridShared(grid, seed, args.hands, args.workers, args.chunk, args.dealer_plays)
+            stats = grid.summary()
+            print("decks , system , sims , mean , std , min , max")
+            for k, d in enumerate(grid.decks):
+                for i, name in enumerate(SYSTEM_NAMES):
+                    print(d, ",", name, ",", stats["count"][k], ",", round(stats["mean"][k, i], 2), ",",
+                          round(stats["std"][k, i], 2), ",", stats["min"][k, i], ",", stats["max"][k, i])
+    elif args.out is None:
+        for d, j, winnings in runGrid(range(4, 9), args.sims, seed, args.hands, args.workers, args.chunk,
+                                      args.dealer_plays):
+            for won, name in zip(winnings, SYSTEM_NAMES):
+                print(won, ",", d, ",", name)
+    else:
+        os.makedirs(args.out, exist_ok=True)
+        suffix = ".csv" if args.format == "csv" else ""
+        simWriter = openWriter(os.path.join(args.out, "simulations" + suffix), SIMULATION_COLUMNS, args.format)
+        handWriter = None
+        if args.record_hands:
+            handWriter = openWriter(os.path.join(args.out, "hands" + suffix), HAND_COLUMNS, args.format)
+        systems = np.arange(len(SYSTEM_NAMES))
+        for d, j, winnings in runGrid(range(4, 9), args.sims, seed, args.hands, args.workers, args.chunk,
+                                      args.dealer_plays, handWriter):
+            simWriter.append(won=winnings, decks=d, system=systems, sim=j)
+        simWriter.close()
+        if handWriter is not None:
+            handWriter.close()
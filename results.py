@@ -0,0 +1,273 @@
+# Writing simulation results somewhere other than stdout
+#
+# A results table is a directory with one raw binary file per column plus a schema.json.
+# Rows are collected in fixed size numpy buffers and appended to the column files a chunk
+# at a time, so nothing is formatted as text and memory use doesn't grow with the run.
+# Reading it back memory-maps each column file, so a billion-row column costs nothing
+# until you look at it.
+#
+# CSV is there too for anything that wants text (Minitab), written the same chunked way.
+#
+# SharedGrid keeps a whole decks x simulations x systems table of winnings in shared memory,
+# so worker processes can write their cells straight into it and the parent can summarize it
+# in place, without anything being pickled on the way.
+import csv
+import json
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from blackjack import SYSTEM_NAMES
+
+# One row per simulation per player, the same thing blackjack.py prints
+SIMULATION_COLUMNS = [("won", "i8"), ("decks", "i1"), ("system", "i1"), ("sim", "i4")]
+
+# One row per player per hand.  bet includes any double, net is how much the bankroll moved
+# (only the first bet is taken up front, so a lost double costs the original bet), count
+# and trueCount are the player's counts when the bet was made.
+HAND_COLUMNS = [("sim", "i4"), ("hand", "i4"), ("system", "i1"), ("decks", "i1"),
+                ("bet", "i4"), ("net", "i4"), ("count", "i2"), ("trueCount", "i2")]
+
+# system columns hold an index into this
+LABELS = {"system": SYSTEM_NAMES}
+
+
+class ColumnWriter:
+    """Appends rows to a directory of column files, bufferRows rows at a time"""
+
+    def __init__(self, path, columns, bufferRows=1 << 16):
+        self.path = path
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.bufferRows = bufferRows
+        self.buffers = {name: np.empty(bufferRows, dtype) for name, dtype in self.columns}
+        self.used = 0
+        self.rows = 0
+        os.makedirs(path, exist_ok=True)
+        self.files = {name: open(os.path.join(path, name + ".bin"), "wb") for name, dtype in self.columns}
+        self.writeSchema()
+
+    def writeSchema(self):
+        schema = {"columns": [[name, dtype.str] for name, dtype in self.columns],
+                  "labels": {k: v for k, v in LABELS.items() if k in self.buffers},
+                  "rows": self.rows}
+        with open(os.path.join(self.path, "schema.json"), "w") as f:
+            json.dump(schema, f)
+
+    def append(self, **columns):
+        """Adds rows, given as one array (or scalar) per column, all the same length"""
+        n = max(np.size(v) for v in columns.values())
+        start = 0
+        while start < n:
+            take = min(n-start, self.bufferRows-self.used)
+            for name, dtype in self.columns:
+                value = columns[name]
+                if np.ndim(value):
+                    value = value[start:start+take]
+                self.buffers[name][self.used:self.used+take] = value
+            self.used += take
+            start += take
+            if self.used == self.bufferRows:
+                self.flush()
+
+    def flush(self):
+        for name, dtype in self.columns:
+            self.buffers[name][:self.used].tofile(self.files[name])
+            self.files[name].flush()
+        self.rows += self.used
+        self.used = 0
+
+    def close(self):
+        self.flush()
+        for f in self.files.values():
+            f.close()
+        self.writeSchema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvWriter:
+    """Same as ColumnWriter but writes a CSV file, with label columns written out as text"""
+
+    def __init__(self, path, columns, bufferRows=1 << 16):
+        self.path = path
+        self.names = [name for name, dtype in columns]
+        self.bufferRows = bufferRows
+        self.pending = []
+        self.used = 0
+        self.file = open(path, "w", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.names)
+
+    def append(self, **columns):
+        n = max(np.size(v) for v in columns.values())
+        cols = []
+        for name in self.names:
+            value = np.broadcast_to(columns[name], (n,))
+            if name in LABELS:
+                value = np.asarray(LABELS[name], dtype=object)[value]
+            cols.append(value.tolist())
+        self.pending.extend(zip(*cols))
+        self.used += n
+        if self.used >= self.bufferRows:
+            self.flush()
+
+    def flush(self):
+        self.writer.writerows(self.pending)
+        self.pending = []
+        self.used = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColumnBuffer:
+    """Collects appended rows in memory, for handing a chunk of results to another process"""
+
+    def __init__(self, columns):
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.chunks = []
+
+    def append(self, **columns):
+        n = max(np.size(v) for v in columns.values())
+        self.chunks.append({name: np.broadcast_to(columns[name], (n,)).astype(dtype)
+                            for name, dtype in self.columns})
+
+    def data(self):
+        """{name: array} of everything appended so far"""
+        return {name: np.concatenate([c[name] for c in self.chunks]) if self.chunks else np.empty(0, dtype)
+                for name, dtype in self.columns}
+
+
+def openWriter(path, columns, format="columnar", bufferRows=1 << 16):
+    """A ColumnWriter or CsvWriter for path, depending on format"""
+    if format == "csv":
+        return CsvWriter(path, columns, bufferRows)
+    if format == "columnar":
+        return ColumnWriter(path, columns, bufferRows)
+    raise ValueError("unknown results format %r" % format)
+
+
+def readColumns(path):
+    """Memory-maps every column of a results directory, returns {name: read-only array}"""
+    with open(os.path.join(path, "schema.json")) as f:
+        schema = json.load(f)
+    columns = {}
+    for name, dtype in schema["columns"]:
+        filename = os.path.join(path, name + ".bin")
+        # The row count comes from the file size, so a run that died before close() can still be read
+        if os.path.getsize(filename) == 0:
+            columns[name] = np.empty(0, dtype)
+        else:
+            columns[name] = np.memmap(filename, dtype=dtype, mode="r")
+    return columns
+
+
+def readLabels(path):
+    """The label lists for the columns that hold indexes, like system"""
+    with open(os.path.join(path, "schema.json")) as f:
+        return json.load(f)["labels"]
+
+
+class HandRecorder:
+    """Collects per-hand records from a BatchTable as it plays (pass its record method as onHand)"""
+
+    def __init__(self, writer, sims):
+        self.writer = writer
+        self.sims = np.asarray(sims, dtype=np.int32)
+
+    def record(self, hand, table):
+        seats, tables = table.bets.shape
+        self.writer.append(sim=np.tile(self.sims, seats),
+                           hand=hand,
+                           system=np.repeat(np.arange(seats), tables),
+                           decks=np.tile(table.decks, seats),
+                           bet=table.bets.ravel(),
+                           net=table.net.ravel(),
+                           count=table.betCount.ravel(),
+                           trueCount=table.betTrueCount.ravel())
+
+
+class SharedGrid:
+    """Winnings indexed by (decks, simulation, system) in shared memory, one cell filled in at a time
+
+    Made without a name, it creates the memory (and should be unlinked when done, or used in a
+    with block).  Made with the name of an existing one, it attaches to it, which is what the
+    worker processes do."""
+
+    def __init__(self, decks, sims, name=None):
+        self.decks = list(decks)
+        self.sims = sims
+        self.deckIndex = {d: k for k, d in enumerate(self.decks)}
+        shape = (len(self.decks), sims, len(SYSTEM_NAMES))
+        size = int(np.prod(shape))*8 + len(self.decks)*sims
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        # winnings first, then a flag per cell saying it's been filled in
+        self.array = np.ndarray(shape, dtype=np.int64, buffer=self.memory.buf)
+        self.filled = np.ndarray(shape[:2], dtype=bool, buffer=self.memory.buf, offset=self.array.nbytes)
+        if self.owner:
+            self.array[:] = 0
+            self.filled[:] = False
+
+    def put(self, decks, sim, winnings):
+        k = self.deckIndex[decks]
+        self.array[k, sim] = winnings
+        self.filled[k, sim] = True
+
+    def summary(self, block=4096):
+        """{statistic: (decks, systems) array} over the cells filled in so far, read in place
+
+        The grid is gone through block simulations at a time, so the only temporaries are a
+        block's worth, however many simulations there are."""
+        numDecks, sims, systems = self.array.shape
+        count = self.filled.sum(axis=1)
+        total = np.zeros((numDecks, systems), dtype=np.int64)
+        low = np.full((numDecks, systems), np.iinfo(np.int64).max)
+        high = np.full((numDecks, systems), np.iinfo(np.int64).min)
+        for start in range(0, sims, block):
+            part = self.array[:, start:start+block]
+            mask = self.filled[:, start:start+block, None]
+            total += np.sum(part, axis=1, where=mask)
+            np.minimum(low, np.min(part, axis=1, where=mask, initial=low.max()), out=low)
+            np.maximum(high, np.max(part, axis=1, where=mask, initial=high.min()), out=high)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total/count[:, None]
+            # a second pass for the squares about the mean, which is steadier than sums of squares
+            squares = np.zeros((numDecks, systems))
+            for start in range(0, sims, block):
+                part = self.array[:, start:start+block] - mean[:, None, :]
+                squares += np.sum(np.square(part, out=part), axis=1, where=self.filled[:, start:start+block, None])
+            std = np.sqrt(squares/(count[:, None] - 1))
+        return {"count": count, "mean": mean, "std": std, "min": low, "max": high}
+
+    def close(self):
+        # the arrays point into the memory, so they have to go before it can be closed
+        del self.array, self.filled
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        if self.owner:
+            self.unlink()
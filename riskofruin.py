@@ -0,0 +1,140 @@
+# Bankroll questions answered from hands that were already played
+#
+# "How likely is a $10,000 bankroll to go broke?" doesn't need new simulations.  A run with
+# --record-hands (parallel.py) has every hand's bet and net for every player, and stringing
+# random stretches of those hands together gives as many bankroll histories as we like
+# (a block bootstrap).  Stretches are taken from inside one simulation, so the runs of big bets
+# a counter makes when the count is high stay together the way they happened.
+#
+# The histories are played a hand at a time, thousands at once, as numpy arrays: the bankroll,
+# its high point, the worst drop from a high point, whether it's gone broke and when it first doubled.
+#
+# python parallel.py --out results --record-hands
+# python riskofruin.py results/hands --bankroll 10000 --hands 2000 --trajectories 1000000
+import argparse
+import math
+import sys
+
+import numpy as np
+
+from blackjack import SYSTEM_NAMES
+from parallel import runCells
+from results import readColumns
+
+QUANTILES = [0.5, 0.9, 0.95, 0.99]
+
+
+def handSequences(columns, system, decks=None):
+    """One counting system's nets, each simulation's hands in order, and where each simulation starts
+
+    columns is from results.readColumns (or runCells with recordHands), system a name from
+    SYSTEM_NAMES, and decks, if given, keeps only those deck counts."""
+    keep = columns["system"] == SYSTEM_NAMES.index(system)
+    if decks is not None:
+        keep &= np.isin(columns["decks"], decks)
+    sims, deckCounts, hand, net = (np.asarray(columns[name])[keep] for name in ["sim", "decks", "hand", "net"])
+    order = np.lexsort((hand, sims, deckCounts))
+    sims, deckCounts, net = sims[order], deckCounts[order], net[order]
+    newSequence = np.ones(len(net), dtype=bool)
+    newSequence[1:] = (sims[1:] != sims[:-1]) | (deckCounts[1:] != deckCounts[:-1])
+    return net.astype(np.int64), np.flatnonzero(newSequence)
+
+
+def blockStarts(length, sequenceStarts, blockSize):
+    """Every place a block of blockSize hands can start without running into the next simulation"""
+    ends = np.append(sequenceStarts[1:], length)
+    starts = [np.arange(s, e-blockSize+1) for s, e in zip(sequenceStarts, ends) if e-s >= blockSize]
+    if not starts:
+        raise ValueError("no simulation has %d hands, use a smaller block" % blockSize)
+    return np.concatenate(starts)
+
+
+def bootstrap(nets, sequenceStarts, bankroll=10000, hands=1000, trajectories=100000, blockSize=20,
+              ruinBelow=100, seed=None, chunk=16384):
+    """Plays trajectories bankroll histories of up to hands hands each, built from blocks of nets
+
+    A history is ruined, and stops, once the bankroll is under ruinBelow (it can't cover the
+    table minimum).  Returns a dict of ruin chance, drawdown and time to double quantiles."""
+    rng = np.random.default_rng(seed)
+    starts = blockStarts(len(nets), sequenceStarts, blockSize)
+    # Every block of hands as a row (a view, nothing is copied), so a whole block for every
+    # history comes out in one gather instead of one scattered gather per hand
+    windows = np.lib.stride_tricks.sliding_window_view(nets.astype(np.int32), blockSize)
+    final = np.empty(trajectories, dtype=np.int32)
+    drawdown = np.empty(trajectories, dtype=np.int32)
+    ruined = np.empty(trajectories, dtype=bool)
+    doubledAt = np.empty(trajectories, dtype=np.int32)
+    # The histories are played chunk by chunk, which keeps the dozen arrays each hand
+    # touches small enough to stay in the cache.  It's about three times quicker.
+    for first in range(0, trajectories, chunk):
+        part = slice(first, min(first+chunk, trajectories))
+        n = part.stop - part.start
+        money = np.full(n, bankroll, dtype=np.int32)
+        peak = money.copy()
+        worst = np.zeros(n, dtype=np.int32)
+        alive = np.ones(n, dtype=bool)
+        doubled = np.full(n, -1, dtype=np.int32)
+        change = np.empty(n, dtype=np.int32)
+        played = 0
+        while played < hands:
+            block = windows[starts[rng.integers(len(starts), size=n)]].T.copy()
+            for k in range(min(blockSize, hands-played)):
+                np.multiply(block[k], alive, out=change)
+                money += change
+                played += 1
+                np.maximum(peak, money, out=peak)
+                np.subtract(peak, money, out=change)
+                np.maximum(worst, change, out=worst)
+                doubled[(doubled < 0) & (money >= 2*bankroll)] = played
+                alive &= money >= ruinBelow
+        final[part], drawdown[part], ruined[part], doubledAt[part] = money, worst, ~alive, doubled
+    timeToDouble = np.where(doubledAt < 0, np.inf, doubledAt)
+    return {"trajectories": trajectories,
+            "ruin": ruined.mean(),
+            "drawdown": dict(zip(QUANTILES, np.quantile(drawdown, QUANTILES, method="inverted_cdf"))),
+            "doubled": (doubledAt >= 0).mean(),
+            "timeToDouble": dict(zip(QUANTILES, np.quantile(timeToDouble, QUANTILES, method="inverted_cdf"))),
+            "finalMean": final.mean()}
+
+
+def simulateHands(decks=range(4, 9), sims=100, seed=0, hands=200, dealerPlays=False):
+    """Plays the grid with hand recording on, for when there's no recorded run to hand"""
+    cells = [(d, j) for d in decks for j in range(sims)]
+    rows, columns = runCells(cells, seed, hands, dealerPlays, recordHands=True)
+    return columns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Risk of ruin, drawdowns and time to double, bootstrapped from recorded hands")
+    parser.add_argument("hands_path", nargs="?", help="hands results directory (parallel.py --record-hands), "
+                                                    "or leave it out to simulate some hands first")
+    parser.add_argument("--bankroll", type=int, default=10000)
+    parser.add_argument("--hands", type=int, default=1000, help="hands in each bankroll history")
+    parser.add_argument("--trajectories", type=int, default=100000, help="bankroll histories per system")
+    parser.add_argument("--block", type=int, default=20, help="hands in a row taken from the same simulation")
+    parser.add_argument("--ruin-below", type=int, default=100, help="broke once the bankroll is under this")
+    parser.add_argument("--decks", type=int, nargs="+", default=None, help="only use hands from these deck counts")
+    parser.add_argument("--systems", nargs="+", default=SYSTEM_NAMES, choices=SYSTEM_NAMES)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--sims", type=int, default=100, help="simulations per deck count, without a hands_path")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn, without a hands_path")
+    args = parser.parse_args()
+
+    if args.hands_path is None:
+        sys.stderr.write("no recorded hands given, simulating %d per deck count\n" % args.sims)
+        columns = simulateHands(args.decks or range(4, 9), args.sims, args.seed or 0, dealerPlays=args.dealer_plays)
+    else:
+        columns = readColumns(args.hands_path)
+
+    def show(value):
+        return "never" if math.isinf(value) else "%d" % value
+
+    print("system , ruin , doubled , " + " , ".join("drawdown %d%%" % (q*100) for q in QUANTILES) + " , " +
+          " , ".join("hands to double %d%%" % (q*100) for q in QUANTILES) + " , mean final")
+    for system in args.systems:
+        nets, sequenceStarts = handSequences(columns, system, args.decks)
+        r = bootstrap(nets, sequenceStarts, args.bankroll, args.hands, args.trajectories, args.block,
+                      args.ruin_below, args.seed)
+        print(system, ",", round(r["ruin"], 4), ",", round(r["doubled"], 4), ",",
+              " , ".join(show(r["drawdown"][q]) for q in QUANTILES), ",",
+              " , ".join(show(r["timeToDouble"][q]) for q in QUANTILES), ",", round(r["finalMean"], 2))
@@ -0,0 +1,185 @@
+# A table with any number of seats, kept as parallel lists instead of player objects
+#
+# Table in blackjack.py has its five players written out one by one at every step.  SeatTable
+# has a list entry per seat for each thing a player carries from hand to hand or within a
+# hand (hand state, bet, bankroll, running and true count), plus the seat's counting system
+# and strategy, and every step is a loop over the seats.  Any number of seats works, and
+# adding one is another entry in each list rather than another object.
+#
+# Seated as SYSTEM_NAMES with the default strategy it plays exactly like Table, card for
+# card (see checkAgainstTable).
+#
+# python seats.py --seats none HiLo HiLo KO Zen hiOpt none     seven seats, two of them HiLo
+import argparse
+
+from blackjack import BET_RAMP, SYSTEM_NAMES, Player, Shoe, Table, payout
+from counting import COUNTING_SYSTEMS, countHistogram, trueCount
+from handstate import DOUBLE, EMPTY, MAX_TOTAL, NEXT, STAND, TOTAL, TWO_CARDS
+from parallel import cellRng
+
+
+class _Hand:
+    def __init__(self, total):
+        self.total = total
+
+
+# payout() for every pair of totals, PAYOUT[player total+1][dealer total+1] (a blackjack is -1)
+PAYOUT = tuple(tuple(payout(_Hand(p), _Hand(d)) for d in range(-1, MAX_TOTAL+1)) for p in range(-1, MAX_TOTAL+1))
+
+
+class SeatTable:
+    """The dealer and any number of seats at one shoe, each seat a counting system and a strategy"""
+
+    def __init__(self, shoe, systems=SYSTEM_NAMES, strategies=None, dealerPlays=False, betRamp=None):
+        """systems has a name from COUNTING_SYSTEMS, or "none", for each seat
+
+        strategies, if given, has a strategy[state][dealer card] table for each seat (None
+        for the default one).  dealerPlays and betRamp work like they do for Table."""
+        n = len(systems)
+        self.shoe = shoe
+        self.dealerPlays = dealerPlays
+        self.betRamp = BET_RAMP if betRamp is None else betRamp
+        self.systems = list(systems)
+        self.tags = [None if name == "none" else COUNTING_SYSTEMS[name] for name in systems]
+        self.counters = [k for k in range(n) if self.tags[k] is not None]
+        strategies = strategies or [None]*n
+        self.strategies = [Player.strategy if s is None else s for s in strategies]
+        self.handsPlayed = 0
+
+        self.money = [10000]*n      # the initial amount of cash
+        self.cardCount = [0]*n
+        self.actualCount = [0]*n    # count when we compensate for number of cards left in the shoe
+        self.states = [EMPTY]*n
+        self.totals = [0]*n         # the total payout sees, which for a double is from before the card
+        self.bets = [0]*n
+        self.doubled = [False]*n
+        self.dealerTotal = 0        # stays 0 when the dealer doesn't play, like Dealer.total
+
+    def placeBet(self, k):
+        """Seat k's bet, the same as Player.placeBet or CountingPlayer.placeBet"""
+        if self.tags[k] is None:
+            return 100
+        shoe = self.shoe
+        if shoe.refill:
+            # The first counter to play after a refill is the one that notices it
+            shoe.refill = False
+            self.cardCount[k] = 0
+            self.actualCount[k] = 0
+        elif shoe.continuous:
+            self.cardCount[k] = 0  # the cards it counted are back in the shoe
+            self.actualCount[k] = 0
+        ramp = self.betRamp
+        return ramp[min(max(self.cardCount[k]-1, 0), len(ramp)-1)]
+
+    def playHand(self):
+        """Plays one hand"""
+        shoe, states, seats = self.shoe, self.states, range(len(self.systems))
+        seen = [0]*12
+
+        # DEAL
+        shoe.newRound()
+        for k in seats:
+            cards = shoe.deal(2)
+            states[k] = NEXT[NEXT[EMPTY][cards[0]]][cards[1]]
+            seen[cards[0]] += 1
+            seen[cards[1]] += 1
+        cards = shoe.deal(2)
+        dealerState = NEXT[NEXT[EMPTY][cards[0]]][cards[1]]
+        upCard = cards[1]
+        seen[cards[0]] += 1
+        seen[cards[1]] += 1
+
+        # PLAY, each seat in turn the way Player.play does it
+        for k in seats:
+            bet = self.placeBet(k)
+            self.money[k] -= bet
+            strategy = self.strategies[k]
+            state = states[k]
+            doubled = False
+            while True:
+                self.totals[k] = TOTAL[state]
+                whatToDo = strategy[state][upCard]
+                if whatToDo == DOUBLE and not TWO_CARDS[state]:
+                    whatToDo = STAND
+                if whatToDo == STAND:
+                    break
+                card = shoe.deal(1)[0]
+                seen[card] += 1
+                state = NEXT[state][card]
+                if whatToDo == DOUBLE:
+                    bet = bet*2
+                    doubled = True
+                    break
+            states[k] = state
+            self.bets[k] = bet
+            self.doubled[k] = doubled
+        if self.dealerPlays:
+            while True:
+                self.dealerTotal = TOTAL[dealerState]
+                if self.dealerTotal == -1 or self.dealerTotal >= 17:
+                    break
+                card = shoe.deal(1)[0]
+                seen[card] += 1
+                dealerState = NEXT[dealerState][card]
+
+        # RESOLVE HAND
+        paid = PAYOUT
+        dealer = self.dealerTotal + 1
+        for k in seats:
+            self.money[k] += self.bets[k]*paid[self.totals[k]+1][dealer]
+
+        # COUNT CARDS, the same way CountingPlayer.addCount does
+        for k in self.counters:
+            self.cardCount[k] += countHistogram(self.tags[k], seen)
+            if shoe.pipTotal > 0:
+                self.actualCount[k] = trueCount(self.cardCount[k], shoe)
+            else:
+                self.cardCount[k] = 0
+                self.actualCount[k] = 0
+        self.handsPlayed += 1
+
+    def winnings(self):
+        """How much each seat has won so far"""
+        return [m - 10000 for m in self.money]
+
+
+def runSeats(shoe, systems=SYSTEM_NAMES, hands=200, dealerPlays=False, strategies=None, betRamp=None):
+    """Plays a number of hands at a SeatTable and returns how much each seat won"""
+    table = SeatTable(shoe, systems, strategies, dealerPlays, betRamp)
+    for k in range(hands):
+        table.playHand()
+    return table.winnings()
+
+
+def checkAgainstTable(decks, seed=0, hands=200, dealerPlays=False, penetration=None, sims=10):
+    """Plays Table and SeatTable on the same shoes and makes sure every seat's winnings agree"""
+    for j in range(sims):
+        expected = Table(Shoe(decks, cellRng(seed, decks, j), penetration=penetration), dealerPlays)
+        table = SeatTable(Shoe(decks, cellRng(seed, decks, j), penetration=penetration), SYSTEM_NAMES,
+                          dealerPlays=dealerPlays)
+        for k in range(hands):
+            expected.playHand()
+            table.playHand()
+        if table.winnings() != expected.winnings():
+            raise AssertionError("simulation %d with %d decks: seats %s, Table %s"
+                                 % (j, decks, table.winnings(), expected.winnings()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play the decks x simulations grid with any seats at the table")
+    parser.add_argument("--seats", nargs="+", default=SYSTEM_NAMES, choices=SYSTEM_NAMES,
+                        help="the counting system of each seat, in order")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--penetration", type=float, default=None, help="deal this much of the shoe before reshuffling")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    args = parser.parse_args()
+
+    # amount won, decks, seat, counting system
+    for d in range(4, 9):
+        for j in range(args.sims):
+            shoe = Shoe(d, cellRng(args.seed, d, j), penetration=args.penetration)
+            winnings = runSeats(shoe, args.seats, args.hands, args.dealer_plays)
+            for seat, (won, name) in enumerate(zip(winnings, args.seats)):
+                print(won, ",", d, ",", seat, ",", name)
@@ -0,0 +1,109 @@
+# Run simulations until the answers are good enough, instead of a fixed 100 of them
+#
+# For every (decks, counting system) cell we keep a running mean and variance of the net
+# winnings per simulation (Welford's method, so nothing but three numbers per cell).  After
+# every round of simulations each cell's confidence interval is checked, and a cell whose
+# half-width is under the target stops taking data.  A deck count is only played again while
+# one of its systems still hasn't settled down, so the work goes where the noise is.
+#
+# Simulations are seeded per cell like parallel.py, so a run can be repeated exactly.
+import argparse
+import math
+import sys
+from statistics import NormalDist
+
+import numpy as np
+
+from blackjack import SYSTEM_NAMES
+from parallel import runCells
+
+
+class RunningStats:
+    """Count, mean and variance kept up to date one batch of values at a time"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0   # sum of squared differences from the mean
+
+    def addMany(self, values):
+        """Adds a batch at once by combining its own mean and variance with ours (Chan et al.)"""
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return
+        mean = values.mean()
+        m2 = ((values - mean)**2).sum()
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta*n/total
+        self.m2 += m2 + delta*delta*self.count*n/total
+        self.count = total
+
+    def variance(self):
+        """Sample variance, 0 until there are two values"""
+        return self.m2/(self.count-1) if self.count > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+    def halfWidth(self, confidence=0.95):
+        """Half-width of the normal confidence interval on the mean, infinite until there are two values"""
+        if self.count < 2:
+            return math.inf
+        z = NormalDist().inv_cdf(0.5 + confidence/2)
+        return z*self.std()/math.sqrt(self.count)
+
+
+def runUntilConverged(decks=range(4, 9), target=500.0, confidence=0.95, seed=0, hands=200,
+                      batchSize=50, minSims=20, maxSims=100000, dealerPlays=False, progress=None):
+    """Plays rounds of simulations until every cell's interval is narrower than target
+
+    Returns {(decks, system name): RunningStats} and {(decks, system name): converged?}.
+    progress, if given, is called with (decks, sims played so far, stats) after each round."""
+    stats = {(d, name): RunningStats() for d in decks for name in SYSTEM_NAMES}
+    done = {key: False for key in stats}
+    played = {d: 0 for d in decks}
+    while True:
+        active = [d for d in decks if played[d] < maxSims and not all(done[(d, name)] for name in SYSTEM_NAMES)]
+        if not active:
+            break
+        for d in active:
+            take = min(batchSize, maxSims - played[d])
+            cells = [(d, j) for j in range(played[d], played[d] + take)]
+            rows = np.array(runCells(cells, seed, hands, dealerPlays))
+            played[d] += take
+            for k, name in enumerate(SYSTEM_NAMES):
+                key = (d, name)
+                if done[key]:
+                    continue
+                stats[key].addMany(rows[:, k])
+                if stats[key].count >= minSims and stats[key].halfWidth(confidence) <= target:
+                    done[key] = True
+            if progress is not None:
+                progress(d, played[d], stats)
+    return stats, done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate each (decks, system) cell until its mean is pinned down")
+    parser.add_argument("--target", type=float, default=500.0, help="confidence interval half-width to stop at, in dollars")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--batch", type=int, default=50, help="simulations per deck count per round")
+    parser.add_argument("--min-sims", type=int, default=20)
+    parser.add_argument("--max-sims", type=int, default=100000)
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    args = parser.parse_args()
+
+    def progress(d, played, stats):
+        widths = ", ".join("%s %.0f" % (name, stats[(d, name)].halfWidth(args.confidence)) for name in SYSTEM_NAMES)
+        sys.stderr.write("%d decks, %d simulations: %s\n" % (d, played, widths))
+
+    stats, done = runUntilConverged(range(4, 9), args.target, args.confidence, args.seed, args.hands, args.batch,
+                                    args.min_sims, args.max_sims, args.dealer_plays, progress)
+    print("decks , system , simulations , mean , std , halfwidth , converged")
+    for (d, name), s in stats.items():
+        print(d, ",", name, ",", s.count, ",", round(s.mean, 2), ",", round(s.std(), 2), ",",
+              round(s.halfWidth(args.confidence), 2), ",", done[(d, name)])
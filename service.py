@@ -0,0 +1,266 @@
+# A simulation server that stays up, so small questions don't pay for starting Python
+#
+# python service.py --port 8765 --workers 4
+#
+# POST a job to /jobs as JSON and the winnings come back one cell at a time as lines of JSON
+# while they're played, with a last line saying it's done:
+#
+#   curl -s localhost:8765/jobs -d '{"decks": [4, 6], "systems": ["none", "HiLo"], "hands": 200, "sims": 10, "seed": 1}'
+#   {"decks": 4, "sim": 0, "winnings": {"none": 1450, "HiLo": 2300}}
+#   ...
+#   {"done": true, "cells": 20, "seconds": 0.05}
+#
+# Optional fields are dealerPlays, penetration and betRamp, like everywhere else.  Cells are
+# seeded like parallel.py, so the service gives the same numbers as a parallel.py run with that seed.
+#
+# Jobs wait in a queue.  The dispatcher takes everything that's waiting, puts cells with the
+# same settings from different jobs into one BatchTable, and hands that to a pool of worker
+# processes that stay up between jobs, each with its shoes and strategy tables already built.
+# GET /status says how busy it is.
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch import BatchTable, baseShoe
+from blackjack import SYSTEM_NAMES
+from parallel import cellRng
+
+MAX_CELLS = 100000  # per job
+
+
+def warmUp():
+    """Run by each worker when it starts, so the first job doesn't pay for building things"""
+    for d in range(1, 9):
+        baseShoe(d)
+
+
+def playCells(settings, cells):
+    """Plays (seed, decks, sim) cells that share settings in one batch, returns their rows"""
+    hands, dealerPlays, penetration, betRamp = settings
+    rngs = [cellRng(seed, decks, sim) for seed, decks, sim in cells]
+    table = BatchTable([decks for seed, decks, sim in cells], rngs, dealerPlays, penetration=penetration,
+                       betRamp=betRamp)
+    return table.run(hands).tolist()
+
+
+def isWhole(value):
+    # json gives true and false as bools, which Python counts as ints
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parseJob(body):
+    """Checks a job sent to the server and fills in what was left out, raises ValueError if it's no good"""
+    job = json.loads(body)
+    if not isinstance(job, dict):
+        raise ValueError("a job is a JSON object")
+    unknown = set(job) - {"decks", "systems", "hands", "sims", "seed", "dealerPlays", "penetration", "betRamp"}
+    if unknown:
+        raise ValueError("unknown fields %s" % sorted(unknown))
+    decks = job.get("decks", list(range(4, 9)))
+    decks = [decks] if isWhole(decks) else decks
+    if not isinstance(decks, list) or not decks or not all(isWhole(d) and 1 <= d <= 8 for d in decks):
+        raise ValueError("decks should be a number from 1 to 8 or a list of them")
+    systems = job.get("systems", SYSTEM_NAMES)
+    if not isinstance(systems, list) or not systems or \
+            any(not isinstance(name, str) or name not in SYSTEM_NAMES for name in systems):
+        raise ValueError("systems should be a list from %s" % SYSTEM_NAMES)
+    hands, sims, seed = job.get("hands", 200), job.get("sims", 1), job.get("seed", 0)
+    for name, value in [("hands", hands), ("sims", sims), ("seed", seed)]:
+        if not isWhole(value) or value < (0 if name == "seed" else 1):
+            raise ValueError("%s should be a positive whole number" % name)
+    if len(decks)*sims > MAX_CELLS:
+        raise ValueError("a job can have at most %d cells" % MAX_CELLS)
+    penetration = job.get("penetration")
+    if penetration is not None and (isinstance(penetration, bool) or not isinstance(penetration, (int, float))
+                                    or not 0 < penetration <= 1):
+        raise ValueError("penetration should be between 0 and 1")
+    betRamp = job.get("betRamp")
+    if betRamp is not None and (not isinstance(betRamp, list) or not betRamp or
+                                not all(isWhole(b) and b > 0 for b in betRamp)):
+        raise ValueError("betRamp should be a list of bets")
+    dealerPlays = job.get("dealerPlays", False)
+    if not isinstance(dealerPlays, bool):
+        raise ValueError("dealerPlays should be true or false")
+    settings = (hands, dealerPlays, penetration, tuple(betRamp) if betRamp else None)
+    return {"decks": decks, "systems": systems, "sims": sims, "seed": seed, "settings": settings}
+
+
+class Job:
+    """A job waiting for its cells, which the workers drop into results as they finish"""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.cells = [(spec["seed"], d, j) for d in spec["decks"] for j in range(spec["sims"])]
+        self.left = len(self.cells)
+        self.results = queue.Queue()
+        self.started = time.perf_counter()
+
+
+class Dispatcher:
+    """Takes jobs off the queue, batches their cells and keeps the worker pool busy"""
+
+    def __init__(self, workers=None, batchCells=2000):
+        self.pool = multiprocessing.Pool(workers, initializer=warmUp)
+        self.workers = workers or os.cpu_count()
+        self.batchCells = batchCells
+        self.jobs = queue.Queue()
+        # One batch per worker at a time.  Anything sent while they're all busy waits in
+        # jobs, and goes out together in the next round of batches.
+        self.free = threading.Semaphore(self.workers)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.done = 0
+        threading.Thread(target=self.loop, daemon=True).start()
+
+    def submit(self, spec):
+        job = Job(spec)
+        self.jobs.put(job)
+        return job
+
+    def loop(self):
+        while True:
+            self.free.acquire()
+            waiting = [self.jobs.get()]
+            while True:
+                try:
+                    waiting.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            # Cells with the same settings can share a table batch, whichever job they're from
+            groups = {}
+            for job in waiting:
+                for cell in job.cells:
+                    groups.setdefault(job.spec["settings"], []).append((job, cell))
+            first = True
+            for settings, cells in groups.items():
+                for start in range(0, len(cells), self.batchCells):
+                    chunk = cells[start:start+self.batchCells]
+                    if not first:
+                        self.free.acquire()
+                    first = False
+                    with self.lock:
+                        self.running += 1
+                    self.pool.apply_async(playCells, (settings, [cell for job, cell in chunk]),
+                                          callback=lambda rows, chunk=chunk: self.deliver(chunk, rows),
+                                          error_callback=lambda e, chunk=chunk: self.fail(chunk, e))
+
+    def deliver(self, chunk, rows):
+        for (job, (seed, decks, sim)), row in zip(chunk, rows):
+            winnings = {name: row[SYSTEM_NAMES.index(name)] for name in job.spec["systems"]}
+            job.results.put({"decks": decks, "sim": sim, "winnings": winnings})
+            self.finishCell(job)
+        with self.lock:
+            self.running -= 1
+        self.free.release()
+
+    def fail(self, chunk, error):
+        for job in {job for job, cell in chunk}:
+            job.results.put({"error": str(error)})
+        for job, cell in chunk:
+            self.finishCell(job)
+        with self.lock:
+            self.running -= 1
+        self.free.release()
+
+    def finishCell(self, job):
+        job.left -= 1
+        if job.left == 0:
+            job.results.put(None)
+            with self.lock:
+                self.done += 1
+
+    def status(self):
+        with self.lock:
+            return {"workers": self.workers, "queued": self.jobs.qsize(), "batchesRunning": self.running,
+                    "jobsDone": self.done}
+
+
+class Handler(BaseHTTPRequestHandler):
+    dispatcher = None  # set by serve()
+
+    def sendJson(self, code, value):
+        body = json.dumps(value).encode() + b"\n"
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.sendJson(200, self.dispatcher.status())
+        else:
+            self.sendJson(404, {"error": "GET /status or POST /jobs"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            self.sendJson(404, {"error": "GET /status or POST /jobs"})
+            return
+        try:
+            spec = parseJob(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError as e:
+            self.sendJson(400, {"error": str(e)})
+            return
+        job = self.dispatcher.submit(spec)
+        # Lines go out as cells finish, so there's no length to send, the end of the reply
+        # is when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        while True:
+            line = job.results.get()
+            if line is None:
+                line = {"done": True, "cells": len(job.cells), "seconds": round(time.perf_counter() - job.started, 3)}
+            self.wfile.write(json.dumps(line).encode() + b"\n")
+            self.wfile.flush()
+            if "done" in line:
+                break
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown out anything useful
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 128  # the default of 5 turns people away when a script sends a burst of jobs
+    daemon_threads = True
+
+
+def serve(host="127.0.0.1", port=8765, workers=None, batchCells=2000):
+    Handler.dispatcher = Dispatcher(workers, batchCells)
+    server = Server((host, port), Handler)
+    sys.stderr.write("serving on %s:%d with %d workers\n" % (host, port, Handler.dispatcher.workers))
+    try:
+        server.serve_forever()
+    finally:
+        Handler.dispatcher.pool.terminate()
+
+
+def submit(job, host="127.0.0.1", port=8765):
+    """Sends a job to a running server and yields each line of the answer as it comes"""
+    connection = http.client.HTTPConnection(host, port)
+    connection.request("POST", "/jobs", json.dumps(job), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    if response.status != 200:
+        raise ValueError(json.loads(response.read())["error"])
+    for line in response:
+        yield json.loads(line)
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve simulation jobs over HTTP on this machine")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--batch-cells", type=int, default=2000, help="most cells in one batch")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.batch_cells)
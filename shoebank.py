@@ -0,0 +1,120 @@
+# A bank of shoes shuffled ahead of time and kept on disk
+#
+# Shuffling is a good part of what a simulation costs, and two experiments can only be
+# compared card for card if they were dealt the same shoes.  A bank is a directory with
+# shoes.bin, every shoe one byte per card, one after the other, grouped by the number of
+# decks, and index.json saying where each group starts.  BankShoe memory-maps it and deals
+# straight out of the file, so a "shuffle" is moving on to the next shoe in the bank.
+#
+# python shoebank.py shoes --make --count 20000 --seed 1   make a bank of 20000 shoes for 4-8 decks
+# python shoebank.py shoes --sims 100                      the usual sweep, dealt from the bank
+import argparse
+import json
+import os
+
+import numpy as np
+
+from batch import baseShoe
+from blackjack import SYSTEM_NAMES, Shoe, runSimulation
+
+VERSION = 1
+
+
+def makeBank(path, decks=range(4, 9), count=10000, seed=0, chunk=1000):
+    """Shuffles count shoes for each number of decks and writes them to the bank directory path"""
+    os.makedirs(path, exist_ok=True)
+    index = {"version": VERSION, "seed": seed, "decks": {}}
+    offset = 0
+    with open(os.path.join(path, "shoes.bin"), "wb") as f:
+        for d in decks:
+            # a stream of its own for each deck count, so adding a deck count doesn't change the others
+            rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(d,)))
+            base = baseShoe(d)
+            for start in range(0, count, chunk):
+                rows = min(chunk, count - start)
+                rng.permuted(np.tile(base, (rows, 1)), axis=1).tofile(f)
+            index["decks"][str(d)] = {"offset": offset, "shoes": count, "cards": len(base)}
+            offset += count*len(base)
+    # the index goes last, so a bank that was cut short can't be opened
+    with open(os.path.join(path, "index.json"), "w") as f:
+        json.dump(index, f, indent=1)
+
+
+class ShoeBank:
+    """A bank directory, memory-mapped once and shared by every BankShoe dealing from it"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "index.json")) as f:
+            self.index = json.load(f)
+        if self.index["version"] != VERSION:
+            raise ValueError("shoe bank %s is version %s, expected %d" % (path, self.index["version"], VERSION))
+        self.data = memoryview(np.memmap(os.path.join(path, "shoes.bin"), dtype=np.int8, mode="r"))
+
+    def count(self, decks):
+        """How many shoes of this many decks there are"""
+        return self.index["decks"][str(decks)]["shoes"]
+
+    def shoe(self, decks, k):
+        """The k-th shoe of this many decks, as a read-only view into the file"""
+        entry = self.index["decks"][str(decks)]
+        if not 0 <= k < entry["shoes"]:
+            raise IndexError("shoe bank has %d shoes of %d decks, asked for number %d" % (entry["shoes"], decks, k))
+        start = entry["offset"] + k*entry["cards"]
+        return self.data[start:start+entry["cards"]]
+
+
+class BankShoe(Shoe):
+    """A Shoe that deals the bank's shoes start, start+step, start+2*step... instead of shuffling
+
+    Giving simulation j of n start=j and step=n keeps every simulation on shoes of its own.
+    Unlike Shoe, the very first shoe dealt comes from the bank too."""
+
+    def __init__(self, bank, num=6, start=0, step=1, penetration=None):
+        Shoe.__init__(self, num, paranoid=False, penetration=penetration)
+        self.bank = bank
+        self.next = start
+        self.step = step
+        self.shuffle()
+
+    def shuffle(self):
+        self.cards = self.bank.shoe(self.numDecks, self.next)
+        self.next += self.step
+
+    def deal(self, num):
+        """deals num cards from the bank's shoe"""
+        if num > self.cardsLeft:
+            if self.profiler is not None:
+                self.profiler.count("refills")
+            self.reshuffle()
+
+        end = self.cardsLeft
+        self.cardsLeft = end - num
+        l = self.cards[self.cardsLeft:end].tolist()  # the view can't be changed, so the hand is a list
+        l.reverse()
+        for card in l:
+            self.rankCounts[card] -= 1
+            self.pipTotal -= card
+        return l
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Make a bank of shuffled shoes, or run the sweep dealt from one")
+    parser.add_argument("path", help="bank directory")
+    parser.add_argument("--make", action="store_true", help="make the bank instead of dealing from it")
+    parser.add_argument("--count", type=int, default=10000, help="shoes for each number of decks (with --make)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the shuffles (with --make)")
+    parser.add_argument("--sims", type=int, default=100, help="simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="hands per simulation")
+    parser.add_argument("--penetration", type=float, default=None, help="deal this much of the shoe before reshuffling")
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    args = parser.parse_args()
+
+    if args.make:
+        makeBank(args.path, range(4, 9), args.count, args.seed)
+    else:
+        bank = ShoeBank(args.path)
+        for d in range(4, 9):
+            for j in range(args.sims):
+                shoe = BankShoe(bank, d, j, args.sims, args.penetration)
+                for won, name in zip(runSimulation(shoe, args.hands, args.dealer_plays), SYSTEM_NAMES):
+                    print(won, ",", d, ",", name)
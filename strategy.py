@@ -0,0 +1,175 @@
+# Working out the best way to play instead of using the 9x10 matrix
+#
+# Player.betPlayMatrix only covers hard 8 to 16 and was read out of a 4-6 deck table.  This
+# solves hit, stand and double for every hand the players can hold (hard and soft, two cards
+# or more) against each dealer card, for a given number of decks, by dynamic programming over
+# the hand states in handstate.py:
+#
+#   stand    scored against the dealer's exact outcome odds from dealerprob (same rules as payout())
+#   hit      take each card in proportion to the shoe, then do the better of standing or hitting again
+#   double   one more card for twice the bet
+#
+# By default doubles are scored the way the simulators pay them (Player.play, BatchTable),
+# since those are the tables this is for: the hand is paid on its total from before the extra
+# card, and only the first bet came out of the bankroll, so a doubled hand nets 3 first bets
+# when it wins and loses only 1.  That makes doubling worth more than standing on nearly every
+# two-card hand.  simulator=False solves a real table's game instead, where the new total
+# counts and the whole doubled bet is at risk.  Either way only two-card hands can double,
+# the same as in Player.play.
+#
+# The cards the player draws come from a full shoe less the dealer's up card, the same for
+# every hand (the usual way basic strategy is worked out, "total dependent").  A solve takes a
+# fraction of a second, but the tables are also saved to STRATEGY_FILE so every run and every
+# player shares the same ones:
+#
+#   Table(shoe, strategy=strategyFor(6))
+#
+# python strategy.py            print the tables for 4 to 8 decks next to the matrix's expected return
+import argparse
+import json
+import os
+from functools import lru_cache
+
+from blackjack import BET_PLAY_MATRIX
+from dealerprob import ExactEngine, fullShoe, unseen
+from handstate import (ACTION_CODES, BUST, DOUBLE, HIT, NEXT, NUM_STATES, STAND, TOTAL, compileStrategy,
+                       handState, unpackState)
+
+STRATEGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "strategy_tables.json")
+SOLVER_VERSION = 3  # goes up when the solver changes its answers, so old saved tables are solved again
+
+ACTION_LETTERS = {code: letter for letter, code in ACTION_CODES.items()}
+
+
+def _playUpCard(decks, upCard, engine, simulator=True, policy=None):
+    """The action and EV for every state against one up card, the best one or the one policy says"""
+    counts = unseen(decks, [upCard])
+    left = sum(counts)
+    p = [c/left for c in counts]
+    dealer = engine.dealerOutcomes(upCard, counts)
+    stand = [-1.0 if BUST[s] else ExactEngine.standAgainst(TOTAL[s], dealer) for s in range(NUM_STATES)]
+    actions = [STAND]*NUM_STATES
+    values = {}
+
+    def value(state):
+        # What the hand is worth from here on, playing the best way (or policy's way)
+        if state not in values:
+            total, soft, numCards = unpackState(state)
+            if BUST[state]:
+                values[state] = -1.0
+                return -1.0
+            options = {STAND: stand[state]}
+            if TOTAL[state] != -1:  # nobody hits a blackjack
+                options[HIT] = sum(p[card]*value(NEXT[state][card]) for card in range(2, 12))
+                if numCards == 2:  # the only hands the players can double
+                    if simulator:
+                        # paid 2*payout on the total from before the card, less the one bet
+                        # taken up front: a stand worth +-1 comes to 2*(+-1)+1
+                        options[DOUBLE] = 2*stand[state] + 1
+                    else:
+                        options[DOUBLE] = 2*sum(p[card]*stand[NEXT[state][card]] for card in range(2, 12))
+            if policy is None:
+                actions[state] = max(options, key=options.get)
+            else:
+                actions[state] = policy[state][upCard]
+                if actions[state] not in options:
+                    actions[state] = STAND  # what Player.play would do with a double it can't make
+            values[state] = options[actions[state]]
+        return values[state]
+
+    for state in range(NUM_STATES):
+        if unpackState(state)[2] >= 2:
+            value(state)
+    return actions, values
+
+
+def solve(decks, simulator=True, engine=None):
+    """The best strategy[state][dealer card] for a shoe of this many decks
+
+    simulator=True pays doubles the way the simulators do, simulator=False the way a casino does."""
+    engine = engine or ExactEngine()
+    table = [[STAND]*12 for state in range(NUM_STATES)]
+    for upCard in range(2, 12):
+        actions, values = _playUpCard(decks, upCard, engine, simulator)
+        for state in range(NUM_STATES):
+            table[state][upCard] = actions[state]
+    return tuple(tuple(row) for row in table)
+
+
+def expectedReturn(decks, strategy=None, simulator=True, engine=None):
+    """Expected winnings per hand, in first bets, playing strategy (or the best strategy) from a full shoe"""
+    engine = engine or ExactEngine()
+    full = fullShoe(decks)
+    cards = sum(full)
+    ev = 0.0
+    for upCard in range(2, 12):
+        actions, values = _playUpCard(decks, upCard, engine, simulator, strategy)
+        counts = unseen(decks, [upCard])
+        left = sum(counts)
+        for first in range(2, 12):
+            for second in range(2, 12):
+                chance = full[upCard]/cards * counts[first]/left * counts[second]/left
+                ev += chance*values[handState([first, second])]
+    return ev
+
+
+def _encode(strategy):
+    # one string per state, a letter per dealer card 2 to 11 (values 0 and 1 are never dealt)
+    return ["".join(ACTION_LETTERS[a] for a in row[2:]) for row in strategy]
+
+
+def _decode(rows):
+    return tuple(tuple([STAND, STAND] + [ACTION_CODES[letter] for letter in row]) for row in rows)
+
+
+@lru_cache(maxsize=None)
+def strategyFor(decks, simulator=True, path=STRATEGY_FILE):
+    """The solved strategy for this many decks, from path if it's been solved before
+
+    The same table comes back every time, so every player given it shares it."""
+    key = "%d%s" % (decks, "" if simulator else " casino")
+    saved = {"version": SOLVER_VERSION, "tables": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        if saved.get("version") != SOLVER_VERSION:
+            saved = {"version": SOLVER_VERSION, "tables": {}}
+    if key in saved["tables"]:
+        return _decode(saved["tables"][key])
+    strategy = solve(decks, simulator)
+    saved["tables"][key] = _encode(strategy)
+    temp = path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(saved, f, indent=1)
+    os.replace(temp, path)
+    return strategy
+
+
+def printTable(strategy):
+    """Two-card hands, hard 5 to 20 and soft 13 to 20, in the layout of BET_PLAY_MATRIX"""
+    print("          A  2  3  4  5  6  7  8  9  10")
+    for soft, totals in [(0, range(5, 21)), (1, range(13, 21))]:
+        for total in totals:
+            # any two cards making this total will do, they all land in the same state
+            first = 11 if soft else max(2, total-10)
+            state = handState([first, total-first])
+            row = strategy[state]
+            print("%-8s" % ("%s %d" % ("soft" if soft else "hard", total)),
+                  " ".join("%2s" % ACTION_LETTERS[row[card]] for card in [11] + list(range(2, 11))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve the best hit/stand/double table for each number of decks")
+    parser.add_argument("--casino", action="store_true",
+                        help="solve a casino's game, where the new total counts and the whole double is at risk")
+    parser.add_argument("--file", default=STRATEGY_FILE, help="where solved tables are kept")
+    args = parser.parse_args()
+
+    engine = ExactEngine()
+    matrix = compileStrategy(BET_PLAY_MATRIX)
+    for decks in range(4, 9):
+        strategy = strategyFor(decks, not args.casino, args.file)
+        print("\n%d decks: expected return %.4f a hand, the matrix %.4f" % (
+            decks, expectedReturn(decks, strategy, not args.casino, engine),
+            expectedReturn(decks, matrix, not args.casino, engine)))
+        printTable(strategy)
@@ -0,0 +1,228 @@
+# Summaries that keep up with the simulations instead of an export to Minitab afterwards
+#
+# The rows the simulators print (amount won, decks, counting system) were meant for a
+# regression in Minitab of winnings on the number of decks and the counting system.  A
+# SummaryStore takes them one at a time as simulations finish and keeps, for each (decks,
+# system) group, the count, the sum and the sum of squares of the winnings (as whole numbers,
+# so nothing is lost however many are added), the smallest and largest, and a histogram to
+# read quantiles from.  Nothing else is kept, so memory doesn't grow with the number of simulations.
+#
+# Within a group every row has the same decks and system, so its row of the design matrix
+# (1, decks, a dummy for each system but the first) is the same too.  That makes the group
+# sums all the regression needs:  X'X is the sum of count * row row', X'y the sum of sum * row
+# and y'y the sum of the sums of squares.  regression() solves it whenever it's asked.
+#
+# python parallel.py --seed 1 | python summary.py            summarize printed rows
+# python summary.py --simulate --sims 1000 --store runs.json  play the grid, adding to a saved store
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from blackjack import SYSTEM_NAMES
+
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+class _Group:
+    """Running totals for the winnings of one (decks, system)"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.squares = 0
+        self.low = None
+        self.high = None
+        self.buckets = {}  # value//width: how many
+
+    def add(self, won, width):
+        self.count += 1
+        self.total += won
+        self.squares += won*won
+        self.low = won if self.low is None else min(self.low, won)
+        self.high = won if self.high is None else max(self.high, won)
+        bucket = won//width
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+        for value in (other.low, other.high):
+            if value is not None:
+                self.low = value if self.low is None else min(self.low, value)
+                self.high = value if self.high is None else max(self.high, value)
+        for bucket, n in other.buckets.items():
+            self.buckets[bucket] = self.buckets.get(bucket, 0) + n
+
+    def quantile(self, q, width):
+        # the first bucket with at least q of the winnings at or below it, like numpy's
+        # "inverted_cdf".  Winnings are whole bets, so with the default width it's exact.
+        rank = max(1, math.ceil(q*self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(max(bucket*width, self.low), self.high)
+
+
+class SummaryStore:
+    """Count, mean, variance, quantiles and a regression of winnings on decks and system, updated as rows come in
+
+    width is the histogram's bucket size.  Winnings are in steps of 50 with the usual bets,
+    so at 50 the quantiles are exact, and a wider bucket trades accuracy for memory."""
+
+    def __init__(self, width=50):
+        self.width = width
+        self.groups = {}  # (decks, system): _Group
+
+    def add(self, decks, system, won):
+        """Adds one simulation's winnings for one system"""
+        if system not in SYSTEM_NAMES:
+            raise ValueError("unknown counting system %r" % system)
+        key = (int(decks), system)
+        if key not in self.groups:
+            self.groups[key] = _Group()
+        self.groups[key].add(int(won), self.width)
+
+    def addSimulation(self, decks, winnings, systems=SYSTEM_NAMES):
+        """Adds a simulation's winnings for every system, in the order of systems"""
+        for won, system in zip(winnings, systems):
+            self.add(decks, system, won)
+
+    def merge(self, other):
+        """Adds everything in another store, say one filled by another process"""
+        if other.width != self.width:
+            raise ValueError("can't merge stores with buckets of %d and %d" % (self.width, other.width))
+        for key, group in other.groups.items():
+            self.groups.setdefault(key, _Group()).merge(group)
+
+    def keys(self):
+        """The (decks, system) groups, by decks and then in SYSTEM_NAMES order"""
+        return sorted(self.groups, key=lambda key: (key[0], SYSTEM_NAMES.index(key[1])))
+
+    def stats(self, decks, system):
+        """{count, mean, var, std, min, max, quantiles} for one group"""
+        g = self.groups[(decks, system)]
+        var = (g.count*g.squares - g.total*g.total)/(g.count*(g.count-1)) if g.count > 1 else math.nan
+        return {"count": g.count, "mean": g.total/g.count, "var": var, "std": math.sqrt(var),
+                "min": g.low, "max": g.high,
+                "quantiles": {q: g.quantile(q, self.width) for q in QUANTILES}}
+
+    def systems(self):
+        return [name for name in SYSTEM_NAMES if any(system == name for decks, system in self.groups)]
+
+    def designMatrix(self):
+        """The regression's design, a row per group: (names, rows, counts, sums, sums of squares)
+
+        A row is (1, decks, a 0/1 dummy for each system but the first), the first system (usually
+        "none") being the baseline the others are measured against."""
+        systems = self.systems()
+        names = ["intercept", "decks"] + systems[1:]
+        keys = self.keys()
+        rows = np.array([[1, decks] + [int(system == s) for s in systems[1:]] for decks, system in keys], dtype=float)
+        counts = np.array([self.groups[key].count for key in keys], dtype=float)
+        sums = np.array([self.groups[key].total for key in keys], dtype=float)
+        squares = sum(self.groups[key].squares for key in keys)
+        return names, rows, counts, sums, squares
+
+    def regression(self):
+        """Least squares fit of winnings on decks and system dummies, over every row added so far
+
+        Returns {name: (coefficient, standard error)} plus "r2", "residualStd" and "n"."""
+        names, rows, counts, sums, squares = self.designMatrix()
+        n = int(counts.sum())
+        p = len(names)
+        xtx = (rows*counts[:, None]).T @ rows
+        xty = rows.T @ sums
+        if n <= p or np.linalg.matrix_rank(xtx) < p:
+            raise ValueError("not enough to fit yet, it takes at least two deck counts and a row more than %d" % p)
+        coefficients = np.linalg.solve(xtx, xty)
+        residual = max(squares - coefficients @ xty, 0.0)
+        sigma2 = residual/(n - p)
+        errors = np.sqrt(sigma2*np.diag(np.linalg.inv(xtx)))
+        total = sums.sum()
+        spread = squares - total*total/n
+        fit = {name: (coefficients[k], errors[k]) for k, name in enumerate(names)}
+        fit.update({"r2": 1 - residual/spread if spread > 0 else math.nan, "residualStd": math.sqrt(sigma2), "n": n})
+        return fit
+
+    def save(self, path):
+        """Writes the store to path as JSON, to be added to by a later run"""
+        groups = [{"decks": decks, "system": system, "count": g.count, "total": g.total, "squares": g.squares,
+                   "low": g.low, "high": g.high, "buckets": sorted(g.buckets.items())}
+                  for (decks, system), g in self.groups.items()]
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            json.dump({"width": self.width, "groups": groups}, f)
+        os.replace(temp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            saved = json.load(f)
+        store = cls(saved["width"])
+        for entry in saved["groups"]:
+            g = store.groups[(entry["decks"], entry["system"])] = _Group()
+            g.count, g.total, g.squares = entry["count"], entry["total"], entry["squares"]
+            g.low, g.high = entry["low"], entry["high"]
+            g.buckets = {bucket: n for bucket, n in entry["buckets"]}
+        return store
+
+
+def readRows(lines):
+    """(won, decks, system) from printed "amount won , decks , system" rows, skipping anything else"""
+    for line in lines:
+        parts = [part.strip() for part in line.split(",")]
+        if len(parts) == 3 and parts[2] in SYSTEM_NAMES:
+            try:
+                yield int(parts[0]), int(parts[1]), parts[2]
+            except ValueError:
+                pass
+
+
+def printSummary(store):
+    print("decks , system , sims , mean , std , min , " + " , ".join("q%g" % q for q in QUANTILES) + " , max")
+    for decks, system in store.keys():
+        s = store.stats(decks, system)
+        print(decks, ",", system, ",", s["count"], ",", round(s["mean"], 2), ",", round(s["std"], 2), ",", s["min"], ",",
+              " , ".join(str(s["quantiles"][q]) for q in QUANTILES), ",", s["max"])
+    try:
+        fit = store.regression()
+    except ValueError as e:
+        print("\nno regression: %s" % e)
+        return
+    print("\nterm , coefficient , standard error , t")
+    for name, value in fit.items():
+        if isinstance(value, tuple):
+            print(name, ",", round(value[0], 3), ",", round(value[1], 3), ",", round(value[0]/value[1], 2))
+    print("n = %d, R^2 = %.4f, residual std = %.2f" % (fit["n"], fit["r2"], fit["residualStd"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summary statistics and the winnings regression, kept up as simulations finish")
+    parser.add_argument("--simulate", action="store_true", help="play the grid (parallel.py) instead of reading rows from stdin")
+    parser.add_argument("--store", help="add to the store saved here, and save it again afterwards")
+    parser.add_argument("--width", type=int, default=50, help="histogram bucket for the quantiles")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sims", type=int, default=100, help="with --simulate, simulations for each number of decks")
+    parser.add_argument("--hands", type=int, default=200, help="with --simulate, hands per simulation")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    args = parser.parse_args()
+
+    store = SummaryStore.load(args.store) if args.store and os.path.exists(args.store) else SummaryStore(args.width)
+    if args.simulate:
+        from parallel import runGrid
+        for d, j, winnings in runGrid(range(4, 9), args.sims, args.seed, args.hands, args.workers,
+                                      dealerPlays=args.dealer_plays):
+            store.addSimulation(d, winnings)
+    else:
+        for won, decks, system in readRows(sys.stdin):
+            store.add(decks, system, won)
+    if args.store:
+        store.save(args.store)
+    printSummary(store)
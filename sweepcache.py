@@ -0,0 +1,186 @@
+# Parameter sweeps that remember what they've already worked out
+#
+# A sweep is the grid of every combination of deck count, hands per simulation, bet ramp and
+# penetration, with the same number of simulations and seed at each point.  Each (point,
+# counting system) cell is named by a hash of everything that decides its numbers: the point,
+# the system, simulations, seed, whether the dealer plays and batch.ENGINE_VERSION.  Its
+# summary (mean, std, ...) is kept in a cache directory under that hash, so running a sweep
+# again, or a wider one, only plays the points that aren't there yet.
+#
+# The cache is one small JSON file per cell.  Reading a cell marks it as recently used, and
+# once the directory grows past its size limit the least recently used cells are removed.
+#
+# python sweepcache.py --decks 4 6 8 --hands 200 400 --ramp 100,150,200,300 100,200,400,800 --penetration none 0.75
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from batch import ENGINE_VERSION
+from blackjack import BET_RAMP, SYSTEM_NAMES
+from parallel import runCells
+
+
+def cellConfig(decks, hands, betRamp, penetration, system, sims, seed, dealerPlays=False):
+    """Everything that decides a cell's numbers"""
+    return {"engine": ENGINE_VERSION, "decks": decks, "hands": hands, "betRamp": list(betRamp),
+            "penetration": penetration, "system": system, "sims": sims, "seed": seed, "dealerPlays": dealerPlays}
+
+
+def cellKey(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def summarize(winnings):
+    """The aggregate kept for a cell, from its winnings in each simulation"""
+    winnings = np.asarray(winnings, dtype=np.float64)
+    return {"sims": len(winnings), "mean": winnings.mean(), "std": winnings.std(ddof=1) if len(winnings) > 1 else 0.0,
+            "min": winnings.min(), "max": winnings.max()}
+
+
+class ResultCache:
+    """Cell summaries on disk, under their key, removing the least recently used past maxBytes"""
+
+    def __init__(self, path, maxBytes=64 << 20):
+        self.path = path
+        self.maxBytes = maxBytes
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(size for name, used, size in self.entries())
+
+    def entries(self):
+        """(file, last used, bytes) for everything in the cache"""
+        found = []
+        for folder in os.scandir(self.path):
+            if folder.is_dir():
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        found.append((entry.path, stat.st_mtime, stat.st_size))
+        return found
+
+    def file(self, key):
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def get(self, key):
+        """The summary stored under key, or None"""
+        try:
+            with open(self.file(key)) as f:
+                result = json.load(f)["result"]
+        except FileNotFoundError:
+            return None
+        os.utime(self.file(key))  # recently used, so it's the last to go
+        return result
+
+    def put(self, key, config, result):
+        filename = self.file(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        if os.path.exists(filename):
+            self.size -= os.path.getsize(filename)
+        temp = filename + ".tmp"
+        with open(temp, "w") as f:
+            json.dump({"config": config, "result": result}, f)
+        os.replace(temp, filename)
+        self.size += os.path.getsize(filename)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    def evict(self):
+        """Removes the least recently used cells until the cache fits in maxBytes"""
+        for name, used, size in sorted(self.entries(), key=lambda e: e[1]):
+            if self.size <= self.maxBytes:
+                break
+            os.remove(name)
+            self.size -= size
+
+
+def runPoint(args):
+    """Plays every simulation of one point of the grid, returns a summary for each system"""
+    decks, hands, betRamp, penetration, sims, seed, dealerPlays = args
+    rows = np.array(runCells([(decks, j) for j in range(sims)], seed, hands, dealerPlays,
+                             penetration=penetration, betRamp=betRamp))
+    return [summarize(rows[:, k]) for k in range(len(SYSTEM_NAMES))]
+
+
+def sweep(cache, decks=range(4, 9), hands=(200,), betRamps=(BET_RAMP,), penetrations=(None,),
+          systems=SYSTEM_NAMES, sims=100, seed=0, dealerPlays=False, workers=1):
+    """Returns a (config, summary, came from the cache?) for every cell of the grid, in grid order
+
+    Only points with a system missing from the cache are played, and then every system at
+    that point is saved, since they all sit at the same table anyway."""
+    points = list(itertools.product(decks, hands, [list(r) for r in betRamps], penetrations))
+    found = {}
+    missing = []
+    for point in points:
+        keys = [cellKey(cellConfig(*point, system, sims, seed, dealerPlays)) for system in systems]
+        for key in keys:
+            found[key] = cache.get(key)
+        if any(found[key] is None for key in keys):
+            missing.append(point)
+
+    jobs = [point + (sims, seed, dealerPlays) for point in missing]
+    if workers == 1:
+        played = map(runPoint, jobs)
+    else:
+        pool = multiprocessing.Pool(workers)
+        played = pool.imap(runPoint, jobs)
+    fresh = set()
+    try:
+        for point, summaries in zip(missing, played):
+            for system, summary in zip(SYSTEM_NAMES, summaries):
+                config = cellConfig(*point, system, sims, seed, dealerPlays)
+                key = cellKey(config)
+                cache.put(key, config, summary)
+                found[key] = summary
+                fresh.add(key)
+    finally:
+        if workers != 1:
+            pool.terminate()
+
+    cells = []
+    for point in points:
+        for system in systems:
+            config = cellConfig(*point, system, sims, seed, dealerPlays)
+            key = cellKey(config)
+            cells.append((config, found[key], key not in fresh))
+    return cells
+
+
+def penetrationArg(text):
+    return None if text == "none" else float(text)
+
+
+def rampArg(text):
+    return [int(bet) for bet in text.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep the grid, playing only the cells that aren't cached")
+    parser.add_argument("--cache", default="sweepcache", help="cache directory")
+    parser.add_argument("--max-mb", type=float, default=64, help="size limit of the cache")
+    parser.add_argument("--decks", type=int, nargs="+", default=list(range(4, 9)))
+    parser.add_argument("--hands", type=int, nargs="+", default=[200], help="hands per simulation")
+    parser.add_argument("--ramp", type=rampArg, nargs="+", default=[BET_RAMP],
+                        help="counters' bets for a count of 1 or less, 2, 3... like 100,150,200,300")
+    parser.add_argument("--penetration", type=penetrationArg, nargs="+", default=[None], help="fractions, or none")
+    parser.add_argument("--systems", nargs="+", default=SYSTEM_NAMES, choices=SYSTEM_NAMES)
+    parser.add_argument("--sims", type=int, default=100, help="simulations at each point")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dealer-plays", action="store_true", help="let the dealer take his turn")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache, int(args.max_mb*(1 << 20)))
+    cells = sweep(cache, args.decks, args.hands, args.ramp, args.penetration, args.systems, args.sims, args.seed,
+                  args.dealer_plays, args.workers)
+    print("decks , hands , ramp , penetration , system , sims , mean , std")
+    for config, summary, cached in cells:
+        print(config["decks"], ",", config["hands"], ",", "/".join(map(str, config["betRamp"])), ",",
+              config["penetration"], ",", config["system"], ",", summary["sims"], ",", round(summary["mean"], 2), ",",
+              round(summary["std"], 2))
+    hits = sum(cached for config, summary, cached in cells)
+    sys.stderr.write("%d cells, %d from the cache, %d played\n" % (len(cells), hits, len(cells) - hits))